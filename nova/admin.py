@@ -2,7 +2,7 @@
 Admin tools for django-nova models
 """
 
-from django import template
+from django import forms, template
 from django.contrib import admin
 from django.contrib.admin import helpers
 from django.contrib.admin.util import model_ngettext
@@ -11,7 +11,9 @@ from django.shortcuts import render_to_response
 from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext as _
 
-from nova.models import EmailAddress, Newsletter, NewsletterIssue, Subscription
+from nova.helpers import get_template_registry
+from nova.models import EmailAddress, Newsletter, NewsletterIssue, Subscription, TrackedLink, IssueOpen
+from nova.scheduler import send_issues
 
 def send_newsletter_issue(modeladmin, request, queryset):
     """
@@ -22,9 +24,8 @@ def send_newsletter_issue(modeladmin, request, queryset):
     app_label = opts.app_label
 
     if request.POST.get('post'):
-        # Do send
-        for issue in queryset:
-            issue.send()
+        # Do send, sharing delivery between the selected issues
+        send_issues(queryset)
 
         # Notify user
         n = queryset.count()
@@ -69,20 +70,67 @@ class SubscriptionAdmin(admin.ModelAdmin):
     list_filter = ('newsletter', 'active',)
     search_fields = ['email_address__email',]
 
+class NewsletterAdminForm(forms.ModelForm):
+    """
+    Offers the templates listed by the template registry as
+    choices for a newsletter's default template.
+    """
+    def __init__(self, *args, **kwargs):
+        super(NewsletterAdminForm, self).__init__(*args, **kwargs)
+
+        names = get_template_registry().list_templates()
+        current = self.instance.default_template
+        if current and current not in names:
+            names = names + [current]
+
+        if names:
+            self.fields['default_template'].widget = forms.Select(
+                    choices=[('', '---------')] + [(name, name) for name in names])
+
+    class Meta:
+        model = Newsletter
+
 class NewsletterAdmin(admin.ModelAdmin):
-    list_display = ('title', 'active', 'created_at', 'approvers',)    
+    form = NewsletterAdminForm
+    list_display = ('title', 'active', 'send_priority', 'created_at', 'approvers',)
     readonly_fields = ('created_at',)
     list_filter = ('active',)
 
 class NewsletterIssueAdmin(admin.ModelAdmin):
-    list_display = ('subject', 'newsletter', 'sent_at','created_at',)
-    list_filter = ('newsletter',)
+    list_display = ('subject', 'newsletter', 'render_status', 'render_queries', 'sent_at', 'send_paused', 'created_at',)
+    list_filter = ('newsletter', 'render_status', 'send_paused',)
     search_fields = ['subject',]
-    readonly_fields = ('rendered_template', 'sent_at',)
+    readonly_fields = ('render_status', 'rendered_at', 'render_error', 'render_queries', 'render_query_time',
+            'render_query_report', 'stored_template', 'stored_plaintext', 'sent_at', 'send_paused', 'send_cursor',)
+    filter_horizontal = ('newsletters',)
 
     actions = [send_newsletter_issue, send_test_newsletter_issue,]
 
+    # Show what is stored without rendering it, which is left to saving, sending
+    # and the render_issues command
+    def stored_template(self, obj):
+        return obj.get_stored_artifacts()[0] or _("Not rendered")
+    stored_template.short_description = _("Rendered template")
+
+    def stored_plaintext(self, obj):
+        return obj.get_stored_artifacts()[1] or _("Not rendered")
+    stored_plaintext.short_description = _("Rendered plaintext")
+
+class TrackedLinkAdmin(admin.ModelAdmin):
+    list_display = ('url', 'issue', 'clicks', 'created_at',)
+    readonly_fields = ('issue', 'url', 'clicks', 'created_at',)
+    list_filter = ('issue',)
+    search_fields = ['url',]
+
+class IssueOpenAdmin(admin.ModelAdmin):
+    list_display = ('email_address', 'issue', 'opens', 'first_opened_at', 'last_opened_at',)
+    readonly_fields = ('issue', 'email_address', 'opens', 'first_opened_at', 'last_opened_at',)
+    list_filter = ('issue',)
+    search_fields = ['email_address__email',]
+
 admin.site.register(EmailAddress, EmailAddressAdmin)
 admin.site.register(Newsletter, NewsletterAdmin)
 admin.site.register(NewsletterIssue, NewsletterIssueAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
+admin.site.register(TrackedLink, TrackedLinkAdmin)
+admin.site.register(IssueOpen, IssueOpenAdmin)
@@ -0,0 +1,80 @@
+"""
+A static web archive of sent newsletter issues.
+
+When an issue is sent, its premailed html is written to NOVA_ARCHIVE_DIR as
+<issue pk>/index.html, along with a precompressed index.html.gz, so the web
+server can answer "view in browser" requests without running any Python. With
+nginx, for example:
+
+    location /archive/ {
+        alias /var/www/nova/archive/;
+        gzip_static on;
+    }
+
+project specific settings:
+NOVA_ARCHIVE_DIR:
+    The directory to publish sent issues to. Publishing is disabled if unset.
+NOVA_ARCHIVE_URL:
+    The url NOVA_ARCHIVE_DIR is served at, e.g. 'http://example.com/archive/'.
+"""
+import gzip
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils.encoding import smart_str
+
+INDEX_NAME = 'index.html'
+
+def get_archive_dir():
+    return getattr(settings, 'NOVA_ARCHIVE_DIR', None)
+
+def get_archive_url(issue_id):
+    """
+    Return the stable url of an archived issue, or None if
+    NOVA_ARCHIVE_URL is not set.
+    """
+    base_url = getattr(settings, 'NOVA_ARCHIVE_URL', None)
+    if not base_url:
+        return None
+    return '%s%s/' % (base_url if base_url.endswith('/') else base_url + '/', issue_id)
+
+def _write_atomically(path, write):
+    # Write to a temporary file first so the web server never serves a partial file
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            write(f)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def publish(issue_id, html, directory=None):
+    """
+    Write html to the archive as the issue with primary key issue_id, with a
+    gzip variant next to it. Returns the path of the uncompressed file.
+    """
+    directory = os.path.join(directory or get_archive_dir(), str(issue_id))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    html = smart_str(html)
+    path = os.path.join(directory, INDEX_NAME)
+
+    def write_gzip(f):
+        # A fixed mtime keeps the compressed bytes identical for identical html
+        compressed = gzip.GzipFile(filename=INDEX_NAME, mode='wb', fileobj=f, compresslevel=9, mtime=0)
+        compressed.write(html)
+        compressed.close()
+
+    _write_atomically(path, lambda f: f.write(html))
+    _write_atomically(path + '.gz', write_gzip)
+
+    # Give both files the same mtime, which gzip_static style serving expects
+    mtime = os.path.getmtime(path)
+    os.utime(path + '.gz', (mtime, mtime))
+
+    return path
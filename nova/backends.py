@@ -0,0 +1,217 @@
+"""
+An email backend that spreads newsletter mail over several SMTP relays.
+
+project specific settings:
+NOVA_SMTP_RELAYS:
+    A list of dictionaries describing each relay. Recognized keys are host, port,
+    username, password, use_tls and weight (relative share of messages, default 1).
+NOVA_RELAY_MAX_FAILURES:
+    Consecutive failures after which a relay is marked unhealthy. Defaults to 3.
+NOVA_RELAY_RETRY_AFTER:
+    Seconds an unhealthy relay is left alone before it is probed again. Defaults to 60.
+NOVA_RELAY_SLOW_SECONDS:
+    Deliveries slower than this count as a failure of the relay. Defaults to 10.
+
+To use the relay pool for newsletter issues set:
+    NOVA_EMAIL_BACKEND = 'nova.backends.RelayPoolBackend'
+
+Only connection errors and temporary (4xx) SMTP replies count against a relay
+and move the message on to the next relay. A permanent (5xx) rejection of a
+message, e.g. a refused recipient, says nothing about the relay's health.
+"""
+import random
+import smtplib
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+class NoRelayAvailable(Exception):
+    """
+    Exception thrown when every configured relay is unhealthy or has failed a message
+    """
+
+class Relay(object):
+    """
+    A single SMTP relay and its health.
+    """
+    def __init__(self, host, port=25, username=None, password=None, use_tls=False, weight=1):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.weight = weight
+
+        self.failures = 0
+        self.down_until = None
+        self._lock = threading.Lock()
+
+    def is_healthy(self, now=None):
+        """
+        A relay is healthy unless it has been marked down and its
+        retry period has not yet passed.
+        """
+        if self.down_until is None:
+            return True
+        return (now or time.time()) >= self.down_until
+
+    def record_success(self, elapsed):
+        """
+        Record a delivery. Slow deliveries count against the relay.
+        """
+        if elapsed > getattr(settings, 'NOVA_RELAY_SLOW_SECONDS', 10):
+            self.record_failure()
+            return
+
+        with self._lock:
+            self.failures = 0
+            self.down_until = None
+
+    def record_failure(self):
+        """
+        Record a failed delivery, marking the relay unhealthy once
+        it has failed too many times in a row.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures >= getattr(settings, 'NOVA_RELAY_MAX_FAILURES', 3):
+                self.down_until = time.time() + getattr(settings, 'NOVA_RELAY_RETRY_AFTER', 60)
+
+    def get_connection(self, fail_silently=False):
+        """
+        Return a Django SMTP backend for this relay.
+        """
+        return SMTPBackend(host=self.host, port=self.port, username=self.username,
+                password=self.password, use_tls=self.use_tls, fail_silently=fail_silently)
+
+    def __repr__(self):
+        return '<Relay %s:%s>' % (self.host, self.port)
+
+# Relays are shared by every connection in this process so their health survives
+# from one send to the next.
+_relays = None
+
+def get_relays():
+    """
+    Return the process wide list of relays configured by NOVA_SMTP_RELAYS.
+    """
+    global _relays
+    if _relays is None:
+        _relays = [Relay(**relay) for relay in getattr(settings, 'NOVA_SMTP_RELAYS', [])]
+    return _relays
+
+def choose_relay(relays, exclude=()):
+    """
+    Pick a healthy relay at random, weighted by each relay's weight.
+    Returns None if no healthy relay remains.
+    """
+    now = time.time()
+    candidates = [relay for relay in relays if relay not in exclude and relay.is_healthy(now)]
+    if not candidates:
+        return None
+
+    point = random.uniform(0, sum([relay.weight for relay in candidates]))
+    for relay in candidates:
+        point -= relay.weight
+        if point <= 0:
+            return relay
+    return candidates[-1]
+
+def is_relay_failure(error):
+    """
+    Return True if error, raised while delivering a message through a relay,
+    is a problem with the relay (a connection error or a temporary SMTP reply)
+    rather than a permanent rejection of the message.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return not 500 <= error.smtp_code < 600
+    return isinstance(error, (socket.error, IOError, smtplib.SMTPException))
+
+class RelayPoolBackend(BaseEmailBackend):
+    """
+    Sends each message through a healthy relay, chosen by weight. When a relay
+    fails the message is retried on the remaining relays, so one relay going
+    down does not stall a send. Connections to each relay are kept open for
+    the lifetime of the backend.
+    """
+    def __init__(self, relays=None, fail_silently=False, **kwargs):
+        super(RelayPoolBackend, self).__init__(fail_silently=fail_silently)
+        self.relays = relays if relays is not None else get_relays()
+        self.connections = {}
+
+    def open(self):
+        """
+        Connections are opened lazily, as relays are chosen.
+        """
+        return False
+
+    def close(self):
+        for connection in self.connections.values():
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self.connections = {}
+
+    def _get_connection(self, relay):
+        if relay not in self.connections:
+            connection = relay.get_connection()
+            connection.open()
+            self.connections[relay] = connection
+        return self.connections[relay]
+
+    def _drop_connection(self, relay):
+        connection = self.connections.pop(relay, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send(self, message):
+        tried = set()
+
+        while True:
+            relay = choose_relay(self.relays, exclude=tried)
+            if relay is None:
+                if not self.fail_silently:
+                    raise NoRelayAvailable("No healthy relay could deliver the message to %s." % (', '.join(message.recipients()),))
+                return False
+
+            tried.add(relay)
+            start = time.time()
+            try:
+                sent = self._get_connection(relay).send_messages([message])
+            except Exception, e:
+                if not is_relay_failure(e):
+                    # The message was rejected, another relay won't do better
+                    if not self.fail_silently:
+                        raise
+                    return False
+
+                relay.record_failure()
+                self._drop_connection(relay)
+                continue
+
+            relay.record_success(time.time() - start)
+            return bool(sent)
+
+    def send_messages(self, email_messages):
+        """
+        Send one or more EmailMessage objects and return the number of
+        messages sent.
+        """
+        if not email_messages:
+            return
+
+        sent = 0
+        for message in email_messages:
+            if self._send(message):
+                sent += 1
+        return sent
@@ -0,0 +1,31 @@
+#!/usr/bin/env ruby
+# A long lived premailer worker used by nova.workers.PremailerPool.
+#
+# Requests are read from stdin as a header line "<mode> <length>" followed by
+# <length> bytes of HTML, where mode is "html" or "txt". Each response is written
+# to stdout as a header line "<status> <length>" followed by <length> bytes, where
+# status is "ok" or "error". On error the body holds the error message.
+require 'rubygems'
+require 'premailer'
+
+$stdin.binmode
+$stdout.binmode
+$stdout.sync = true
+
+while header = $stdin.gets
+  mode, length = header.split
+  html = $stdin.read(length.to_i)
+
+  begin
+    premailer = Premailer.new(html, :with_html_string => true, :warn_level => Premailer::Warnings::NONE)
+    output = mode == 'txt' ? premailer.to_plain_text : premailer.to_inline_css
+    status = 'ok'
+  rescue Exception => e
+    output = e.message
+    status = 'error'
+  end
+
+  output = output.to_s.dup.force_encoding('BINARY')
+  $stdout.write("#{status} #{output.bytesize}\n")
+  $stdout.write(output)
+end
@@ -0,0 +1,189 @@
+"""
+Time budgets and circuit breakers for the stages of rendering an issue.
+
+Rendering and premailing an issue runs through four stages: render (context
+processors and the template), canonicalize (absolute links), track (campaign
+parameters, click and open tracking) and premail (CSS inlining). Each stage can
+be given a time budget.
+
+A premailer process that runs over budget is killed, and the save or send
+fails with StageTimeout instead of blocking forever. The other stages run in
+process, on the caller's thread and inside its transaction, so they can't be
+interrupted: they are timed instead, and a call that runs over budget returns
+as usual but counts as a failure of the stage. Slow context processors are
+best marked independent (see nova.context), which gives them a timeout of their
+own.
+
+Each stage has a circuit breaker per process. After a stage has failed (run
+over budget, or premailer has crashed) a number of times in a row, it isn't run
+at all for a while and raises StageUnavailable immediately, so saves and sends
+fail fast instead of each waiting out a stage that keeps hanging or running
+slow. Once the while is over, the next call tries the stage again.
+
+project specific settings:
+NOVA_STAGE_BUDGETS:
+    A dictionary of stage name to the number of seconds the stage may take,
+    e.g. {'render': 30, 'premail': 60}. Stages without a budget may take as
+    long as they need. Defaults to {}.
+NOVA_PREMAILER_FALLBACK:
+    Set to 'python' to inline CSS in process (see nova.inliner) when premailer
+    times out or its circuit is open, instead of failing. Defaults to None.
+NOVA_CIRCUIT_BREAKER_THRESHOLD:
+    The number of consecutive failures that opens a stage's circuit. Defaults to 5.
+NOVA_CIRCUIT_BREAKER_RESET:
+    The number of seconds an open circuit stays open. Defaults to 60.
+"""
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('nova.budgets')
+
+STAGES = ('render', 'canonicalize', 'track', 'premail')
+
+class StageTimeout(Exception):
+    """
+    Exception thrown when a stage runs over its time budget
+    """
+
+class StageUnavailable(Exception):
+    """
+    Exception thrown instead of running a stage whose circuit is open
+    """
+
+def get_budget(stage):
+    """
+    Return the time budget of stage in seconds, or None if it has none.
+    """
+    return getattr(settings, 'NOVA_STAGE_BUDGETS', {}).get(stage)
+
+class CircuitBreaker(object):
+    """
+    A thread safe circuit breaker. The circuit opens after threshold
+    consecutive failures, and lets a call through again reset_timeout
+    seconds later. A success closes it.
+    """
+    def __init__(self, name, threshold=5, reset_timeout=60):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Let calls try the stage again; another failure reopens the circuit
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return False
+            return True
+
+    def check(self):
+        """
+        Raise StageUnavailable if the circuit is open.
+        """
+        if self.is_open():
+            raise StageUnavailable("The %s stage failed %d times in a row and is disabled for %s seconds." % (
+                    self.name, self.threshold, self.reset_timeout))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(stage):
+    """
+    Return the process wide circuit breaker of stage.
+    """
+    with _breakers_lock:
+        if stage not in _breakers:
+            _breakers[stage] = CircuitBreaker(stage,
+                    threshold=getattr(settings, 'NOVA_CIRCUIT_BREAKER_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'NOVA_CIRCUIT_BREAKER_RESET', 60))
+        return _breakers[stage]
+
+def reset_breakers():
+    """
+    Close the circuits of all stages.
+    """
+    with _breakers_lock:
+        _breakers.clear()
+
+def communicate(process, input=None, timeout=None):
+    """
+    Like process.communicate(input), but kill the process and raise
+    StageTimeout if it doesn't finish within timeout seconds.
+    """
+    if timeout is None:
+        return process.communicate(input)
+
+    lock = threading.Lock()
+    state = {'finished': False, 'killed': False}
+
+    def kill():
+        # Leave a process that has finished in the meantime alone
+        with lock:
+            if state['finished'] or process.returncode is not None:
+                return
+            try:
+                process.kill()
+            except OSError:
+                return
+            state['killed'] = True
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    out = err = None
+    try:
+        out, err = process.communicate(input)
+    except (IOError, OSError):
+        if not state['killed']:
+            raise
+    finally:
+        with lock:
+            state['finished'] = True
+        timer.cancel()
+
+    if state['killed']:
+        process.wait()
+        # A process that exited just before it was killed has answered in full
+        if out is None or process.returncode == -signal.SIGKILL:
+            raise StageTimeout('Process %s took longer than %s seconds and was killed.' % (process.pid, timeout))
+    return out, err
+
+def run_stage(stage, function, *args, **kwargs):
+    """
+    Call function(*args, **kwargs) as the named stage, behind the stage's
+    circuit breaker, and return its result. A call that takes longer than
+    the stage's budget counts as a failure of the stage.
+    """
+    breaker = get_breaker(stage)
+    breaker.check()
+
+    budget = get_budget(stage)
+    started = time.time()
+    result = function(*args, **kwargs)
+    elapsed = time.time() - started
+
+    if budget is not None and elapsed > budget:
+        logger.warning('The %s stage took %.3f seconds, over its budget of %s seconds.', stage, elapsed, budget)
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return result
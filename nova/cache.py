@@ -0,0 +1,193 @@
+"""
+A content-addressed cache for the output of expensive, deterministic
+transformations such as premailer.
+
+Entries are keyed by a hash of everything that determines the output, so
+they never need to be invalidated. Two stores are supported and may be
+combined: Django's cache framework, and a directory on local disk that is
+kept under a size limit by evicting the least recently used entries.
+
+project specific settings:
+NOVA_PREMAILER_CACHE:
+    If True, cache premailer output in Django's default cache. Defaults to False.
+NOVA_PREMAILER_CACHE_TIMEOUT:
+    Timeout in seconds for entries in Django's cache. Defaults to one week.
+NOVA_PREMAILER_CACHE_DIR:
+    A directory in which to cache premailer output on local disk.
+NOVA_PREMAILER_CACHE_SIZE:
+    The maximum size in bytes of NOVA_PREMAILER_CACHE_DIR. Defaults to 64MB.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.utils.encoding import smart_str
+
+def content_key(*parts):
+    """
+    Return a hex digest identifying the given parts.
+    """
+    digest = sha1()
+    for part in parts:
+        part = smart_str(part)
+        # Length prefix each part so ('ab', 'c') and ('a', 'bc') differ
+        digest.update('%d:' % len(part))
+        digest.update(part)
+    return digest.hexdigest()
+
+class LRUCache(object):
+    """
+    A small, thread safe, in-memory cache that holds at most max_size
+    entries, discarding the least recently used entry first.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+class ContentCache(object):
+    """
+    A two level cache of strings keyed by content_key().
+    """
+    def __init__(self, namespace, use_django_cache=False, timeout=None, directory=None, max_size=None):
+        """
+        :param namespace: A prefix for keys in Django's cache.
+        :param use_django_cache: Whether to store entries in Django's cache.
+        :param timeout: The timeout for entries in Django's cache.
+        :param directory: An optional directory to store entries in on local disk.
+        :param max_size: The maximum total size in bytes of the files in directory.
+        """
+        self.namespace = namespace
+        self.use_django_cache = use_django_cache
+        self.timeout = timeout
+        self.directory = directory
+        self.max_size = max_size
+
+        if self.directory and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Return the entry stored for key, or None.
+        """
+        if self.use_django_cache:
+            value = django_cache.get('%s:%s' % (self.namespace, key))
+            if value is not None:
+                return value
+
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = f.read()
+            except IOError:
+                return None
+
+            # Mark the entry as recently used
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+
+            if self.use_django_cache:
+                django_cache.set('%s:%s' % (self.namespace, key), value, self.timeout)
+            return value
+
+        return None
+
+    def set(self, key, value):
+        """
+        Store value for key.
+        """
+        if self.use_django_cache:
+            django_cache.set('%s:%s' % (self.namespace, key), value, self.timeout)
+
+        if self.directory:
+            # Write to a temporary file first so readers never see a partial entry
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                f.write(value)
+            os.rename(temp_path, self._path(key))
+
+            if self.max_size is not None:
+                self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used files until the directory
+        is no larger than max_size.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        while total > self.max_size and entries:
+            mtime, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+_premailer_cache = None
+
+def get_premailer_cache():
+    """
+    Return the process wide cache for premailer output, or None
+    if caching has not been configured.
+    """
+    global _premailer_cache
+
+    use_django_cache = getattr(settings, 'NOVA_PREMAILER_CACHE', False)
+    directory = getattr(settings, 'NOVA_PREMAILER_CACHE_DIR', None)
+    if not (use_django_cache or directory):
+        return None
+
+    if _premailer_cache is None or _premailer_cache.directory != directory \
+            or _premailer_cache.use_django_cache != use_django_cache:
+        _premailer_cache = ContentCache('nova.premailer',
+                use_django_cache=use_django_cache,
+                timeout=getattr(settings, 'NOVA_PREMAILER_CACHE_TIMEOUT', 60 * 60 * 24 * 7),
+                directory=directory,
+                max_size=getattr(settings, 'NOVA_PREMAILER_CACHE_SIZE', 64 * 1024 * 1024))
+
+    return _premailer_cache
@@ -0,0 +1,147 @@
+"""
+Concurrent, memoized NOVA_CONTEXT_PROCESSORS.
+
+Context processors that do slow lookups which don't depend on each other
+(featured products, recent posts...) can be marked with the independent
+decorator:
+
+    from nova.context import independent
+
+    @independent(timeout=5)
+    def featured_products(newsletter_issue):
+        ...
+
+Independent processors run concurrently in a thread pool while the other
+processors run as usual. A processor that doesn't finish within its timeout
+makes rendering fail with ContextProcessorTimeout. Their results are
+memoized per issue, so a preview, test send and send of the same issue
+don't each repeat the lookups. Since they run on other threads, independent
+processors use their own database connections and don't see uncommitted
+changes made by the thread rendering the issue.
+
+project specific settings:
+NOVA_CONTEXT_PROCESSOR_THREADS:
+    The number of threads running independent processors. Defaults to 4.
+NOVA_CONTEXT_PROCESSOR_TIMEOUT:
+    The default timeout in seconds for independent processors. Defaults to 10.
+NOVA_CONTEXT_PROCESSOR_TTL:
+    The number of seconds the results of independent processors are memoized
+    for each issue. Defaults to 300; 0 disables memoization.
+"""
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import close_connection
+
+class ContextProcessorTimeout(Exception):
+    """
+    Exception thrown when an independent context processor doesn't finish in time
+    """
+
+def independent(timeout=None):
+    """
+    Mark a context processor as independent of the others, so it can run
+    concurrently with them. timeout overrides NOVA_CONTEXT_PROCESSOR_TIMEOUT.
+    """
+    def decorator(processor):
+        processor.independent = True
+        processor.timeout = timeout
+        return processor
+    return decorator
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Return the process wide pool of threads for independent processors.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, 'NOVA_CONTEXT_PROCESSOR_THREADS', 4))
+    return _pool
+
+class ResultMemo(object):
+    """
+    A thread safe memo of results that expire ttl seconds after they are set.
+    """
+    def __init__(self):
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.results.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.results[key]
+                return None
+            return entry[1]
+
+    def set(self, key, result, ttl):
+        with self._lock:
+            # Drop expired results so the memo doesn't grow without bound
+            now = time.time()
+            for expired in [k for k, (expires, r) in self.results.items() if expires < now]:
+                del self.results[expired]
+            self.results[key] = (now + ttl, result)
+
+    def clear(self):
+        with self._lock:
+            self.results.clear()
+
+memo = ResultMemo()
+
+def _run(processor, newsletter_issue):
+    try:
+        return processor(newsletter_issue=newsletter_issue)
+    finally:
+        # Pool threads get their own database connection
+        close_connection()
+
+def run_context_processors(processors, newsletter_issue):
+    """
+    Call each of processors for newsletter_issue and return the list of
+    their context dictionaries, in order. Independent processors run
+    concurrently and their results are memoized.
+    """
+    ttl = getattr(settings, 'NOVA_CONTEXT_PROCESSOR_TTL', 300)
+    default_timeout = getattr(settings, 'NOVA_CONTEXT_PROCESSOR_TIMEOUT', 10)
+
+    results = [None] * len(processors)
+    pending = []
+
+    for index, processor in enumerate(processors):
+        if not getattr(processor, 'independent', False):
+            continue
+
+        key = (processor.__module__, processor.__name__, newsletter_issue.pk)
+        if ttl and newsletter_issue.pk is not None:
+            results[index] = memo.get(key)
+        if results[index] is None:
+            pending.append((index, processor, key, get_pool().apply_async(_run, (processor, newsletter_issue))))
+
+    # Run the other processors while the independent ones are busy
+    for index, processor in enumerate(processors):
+        if not getattr(processor, 'independent', False):
+            results[index] = processor(newsletter_issue=newsletter_issue)
+
+    started = time.time()
+    for index, processor, key, result in pending:
+        timeout = processor.timeout if processor.timeout is not None else default_timeout
+        try:
+            # Processors run concurrently, so each only waits for what's left of its own timeout
+            results[index] = result.get(max(timeout - (time.time() - started), 0))
+        except TimeoutError:
+            raise ContextProcessorTimeout("Context processor '%s.%s' took longer than %s seconds." % (
+                    processor.__module__, processor.__name__, timeout))
+
+        if ttl and newsletter_issue.pk is not None:
+            memo.set(key, results[index], ttl)
+
+    return results
@@ -1,42 +1,255 @@
 """
 Some helper functions for django-nova.
 """
+import os
 import re
 import string
+import threading
 
+from itertools import islice
+from subprocess import Popen, PIPE
 from urllib import urlencode
 from urlparse import urlparse
 
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.template import TemplateDoesNotExist
+from django.core.exceptions import ImproperlyConfigured
+from django.template import Template, TemplateDoesNotExist
 from django.template.loader import find_template_loader
 from django.core.mail import EmailMultiAlternatives
 from django.utils.encoding import smart_str
 
 from BeautifulSoup import BeautifulSoup
 
+from nova.cache import LRUCache, content_key
+
+try:
+    from bs4 import BeautifulSoup as BeautifulSoup4
+except ImportError:
+    BeautifulSoup4 = None
+
 class PremailerException(Exception):
     """
     Exception thrown when premailer command finishes with a return code other than 0
     """
 
+_callables = {}
+
+def get_callables(paths):
+    """
+    Import and return the functions named by a list of dotted paths. Each
+    list of paths is only resolved once per process.
+
+    :param paths: A list of dotted paths, e.g. ('myapp.newsletter.featured_products',).
+    """
+    paths = tuple(paths)
+    if paths not in _callables:
+        functions = []
+        for path in paths:
+            try:
+                module, attr = path.rsplit('.', 1)
+                functions.append(getattr(__import__(module, fromlist=[attr]), attr))
+            except (ValueError, ImportError, AttributeError), e:
+                raise ImproperlyConfigured("Error importing '%s': %s" % (path, e))
+        _callables[paths] = functions
+    return _callables[paths]
+
+def chunks(iterable, size):
+    """
+    Yield lists of up to size consecutive items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+_premailer_version = None
+
+def get_premailer_version():
+    """
+    Return the version string reported by the premailer script. The
+    script is only asked once per process.
+    """
+    global _premailer_version
+    if _premailer_version is None:
+        try:
+            p = Popen(['premailer', '--version'], stdout=PIPE, stderr=PIPE)
+            out, err = p.communicate()
+            _premailer_version = (out or err).strip()
+        except OSError:
+            _premailer_version = ''
+    return _premailer_version
+
+_compiled_templates = None
+
+def compile_template(source):
+    """
+    Return a compiled django Template for source. Compiled templates are kept
+    in an LRU cache keyed by a hash of their source, holding up to
+    NOVA_TEMPLATE_CACHE_SIZE (default 64) templates.
+    """
+    global _compiled_templates
+    if _compiled_templates is None:
+        _compiled_templates = LRUCache(getattr(settings, 'NOVA_TEMPLATE_CACHE_SIZE', 64))
+
+    key = content_key(source)
+    template = _compiled_templates.get(key)
+    if template is None:
+        template = Template(source)
+        _compiled_templates.set(key, template)
+    return template
+
+class TemplateRegistry(object):
+    """
+    A registry of the default templates newsletters can use. Template loaders
+    are instantiated once, template sources are cached and reloaded when the
+    file they came from is modified, and the templates in NOVA_DEFAULT_TEMPLATE_DIR
+    (default 'nova/newsletters') are listed from a cached scan of the template
+    directories that is repeated when one of the scanned directories changes.
+    """
+    def __init__(self, loader_names=None, directory=None):
+        self.loader_names = loader_names
+        self.directory = directory
+        self._loaders = None
+        self._sources = {}
+        self._listing = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaders(self):
+        if self._loaders is None:
+            loader_names = self.loader_names or settings.TEMPLATE_LOADERS
+            self._loaders = [loader for loader in
+                    [find_template_loader(loader_name) for loader_name in loader_names]
+                    if loader is not None]
+        return self._loaders
+
+    def _mtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except (OSError, TypeError):
+            return None
+
+    def get_source(self, name):
+        """
+        Return the raw source of the template called name.
+        """
+        cached = self._sources.get(name)
+        if cached is not None:
+            source, path, mtime = cached
+            if mtime is None or self._mtime(path) == mtime:
+                return source
+
+        for loader in self.loaders:
+            try:
+                source, path = loader.load_template_source(name)
+            except TemplateDoesNotExist:
+                continue
+
+            self._sources[name] = (source, path, self._mtime(path))
+            return source
+
+        raise TemplateDoesNotExist(name)
+
+    def get_template(self, name):
+        """
+        Return the compiled template called name.
+        """
+        return compile_template(self.get_source(name))
+
+    def _template_dirs(self):
+        # Only the stock file based loaders can be listed
+        from django.template.loaders import app_directories, filesystem
+
+        template_dirs = []
+        for loader in self.loaders:
+            if isinstance(loader, filesystem.Loader):
+                template_dirs.extend(settings.TEMPLATE_DIRS)
+            elif isinstance(loader, app_directories.Loader):
+                template_dirs.extend(app_directories.app_template_dirs)
+        return template_dirs
+
+    def _scan(self):
+        directory = self.directory or getattr(settings, 'NOVA_DEFAULT_TEMPLATE_DIR', 'nova/newsletters')
+
+        names = set()
+        scanned = {}
+        for template_dir in self._template_dirs():
+            root = os.path.join(template_dir, directory)
+            for path, dirs, files in os.walk(root):
+                scanned[path] = self._mtime(path)
+                for filename in files:
+                    if not filename.startswith('.'):
+                        names.add(os.path.relpath(os.path.join(path, filename), template_dir))
+            if root not in scanned:
+                # Notice when the directory is created
+                scanned[root] = self._mtime(root)
+
+        return sorted(names), scanned
+
+    def list_templates(self):
+        """
+        Return the sorted names of the templates in NOVA_DEFAULT_TEMPLATE_DIR.
+        """
+        with self._lock:
+            if self._listing is not None:
+                names, scanned = self._listing
+                if all([self._mtime(path) == mtime for path, mtime in scanned.items()]):
+                    return names
+
+            self._listing = self._scan()
+            return self._listing[0]
+
+    def reload(self, name=None):
+        """
+        Forget the cached source of the template called name, or
+        all cached sources and the template listing.
+        """
+        if name is not None:
+            self._sources.pop(name, None)
+        else:
+            self._sources = {}
+            with self._lock:
+                self._listing = None
+
+_template_registry = None
+
+def get_template_registry():
+    """
+    Return the process wide TemplateRegistry.
+    """
+    global _template_registry
+    if _template_registry is None:
+        _template_registry = TemplateRegistry()
+    return _template_registry
+
 def get_raw_template(name):
     """
     Uses Django's template loaders to find and return the
     raw template source. 
     """
-    for loader_name in settings.TEMPLATE_LOADERS:
-        loader = find_template_loader(loader_name)
-        if loader is not None:
-            try:
-                return loader.load_template_source(name)[0]
-            except TemplateDoesNotExist:
-                pass
-    raise TemplateDoesNotExist(name)
+    return get_template_registry().get_source(name)
+
+class SignedEmailMessage(EmailMultiAlternatives):
+    """
+    A multipart email message that is (optionally) DKIM signed whenever
+    it is serialized.
+    """
+    def __init__(self, *args, **kwargs):
+        self.signer = kwargs.pop('signer', None)
+        self.body_key = kwargs.pop('body_key', None)
+        super(SignedEmailMessage, self).__init__(*args, **kwargs)
+
+    def message(self):
+        msg = super(SignedEmailMessage, self).message()
+        if self.signer is not None:
+            self.signer.sign(msg, body_key=self.body_key)
+        return msg
 
 def send_multipart_mail(subject, txt_body, html_body, from_email, recipient_list,
-                        headers=None, fail_silently=False):
+                        headers=None, fail_silently=False, signer=None, connection=None):
     """
     Sends a multipart email with a plaintext part and an html part.
 
@@ -46,23 +259,48 @@ def send_multipart_mail(subject, txt_body, html_body, from_email, recipient_list
     :param from_email: email address from which to send message
     :param recipient_list: list of email addresses to which to send email
     :param fail_silently: whether to raise an exception on delivery failure
+    :param signer: an optional nova.signing.DKIMSigner used to sign the message
+    :param connection: an optional open email backend to send the message through
     """
-    message = EmailMultiAlternatives(subject, body=txt_body,
-                                     from_email=from_email, to=recipient_list, headers=headers)
+    message = SignedEmailMessage(subject, body=txt_body,
+                                 from_email=from_email, to=recipient_list, headers=headers,
+                                 signer=signer, body_key=(txt_body, html_body), connection=connection)
 
     message.attach_alternative(html_body, "text/html")
     return message.send(fail_silently)
 
+def parse_html(html):
+    """
+    Parse an html string into a document tree. Uses BeautifulSoup 3 unless
+    NOVA_HTML_PARSER names a BeautifulSoup 4 tree builder (e.g. 'lxml'), which
+    is considerably faster on large documents. Documents that have already
+    been parsed are returned as is.
+
+    :param html: The html string (or parsed document) to parse.
+    """
+    if not isinstance(html, basestring):
+        return html
+
+    parser = getattr(settings, 'NOVA_HTML_PARSER', None)
+    if parser:
+        if BeautifulSoup4 is None:
+            raise ImproperlyConfigured("NOVA_HTML_PARSER requires the beautifulsoup4 package.")
+        # Keep the class attribute a string, as it is with BeautifulSoup 3
+        return BeautifulSoup4(html, parser, multi_valued_attributes=None)
+
+    return BeautifulSoup(html)
+
 def canonicalize_links(html, base_url=None):
     """
     Parse an html string and replace any relative links with fully qualified links.
-    :param html: The document to canonicalize.
+    :param html: The document to canonicalize. If a parsed document is passed it is
+        modified in place and returned, otherwise a string is returned.
     :param base_url: The (optional) base url to canonicalize to.
     """
     if base_url is None:
         base_url = "http://"+Site.objects.get_current().domain
 
-    soup = BeautifulSoup(html)
+    soup = parse_html(html)
     relative_links = soup.findAll(href=re.compile('^/'))
 
     for link in relative_links:
@@ -73,6 +311,8 @@ def canonicalize_links(html, base_url=None):
     for link in protocol_links:
         link['href'] = 'http://%s' % (link['href'],)
 
+    if soup is html:
+        return soup
     return smart_str(soup)
 
 def get_anchor_text(anchor):
@@ -89,7 +329,7 @@ def get_anchor_text(anchor):
         if len(children) > 0:
             # Check to see if this anchor contains an image
             if anchor.img:
-                if anchor.img.has_key('alt'):
+                if anchor.img.get('alt') is not None:
                     # Get the image alt text
                     alttext = anchor.img['alt']
                 else:
@@ -102,23 +342,95 @@ def get_anchor_text(anchor):
 
 TRACKED_LINK_CLASS = 'tracked'
 
+class DomainMatcher(object):
+    """
+    Matches hosts against a set of domain rules, compiled into a trie of
+    reversed domain labels so a host is matched in one walk over its labels.
+
+    A rule such as 'example.com' matches that domain and all of its
+    subdomains; a rule such as '*.example.com' only matches subdomains.
+    Rules match whole labels, so 'example.com' doesn't match look-alike
+    hosts like 'notexample.com' or 'example.com.evil.org'.
+    """
+    # Trie node keys marking the end of a rule, which can't clash with labels
+    DOMAIN = '.'
+    SUBDOMAINS = '*.'
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.trie = {}
+        for rule in self.rules:
+            rule = rule.strip().lower().rstrip('.')
+            marker = self.DOMAIN
+            if rule.startswith('*.'):
+                rule, marker = rule[2:], self.SUBDOMAINS
+            if not rule:
+                continue
+
+            node = self.trie
+            for label in reversed(rule.split('.')):
+                node = node.setdefault(label, {})
+            node[marker] = True
+
+    def match(self, host):
+        """
+        Return True if host, which may include credentials and a port as in
+        the network location of a url, matches any of the rules.
+        """
+        host = host.rpartition('@')[2].partition(':')[0].lower().rstrip('.')
+        if not host:
+            return False
+
+        labels = host.split('.')
+        node = self.trie
+        for depth in xrange(len(labels) - 1, -1, -1):
+            node = node.get(labels[depth])
+            if node is None:
+                return False
+            if self.DOMAIN in node or (self.SUBDOMAINS in node and depth > 0):
+                return True
+        return False
+
+_domain_matchers = {}
+
+def get_domain_matcher(domains):
+    """
+    Return a DomainMatcher for domains, which is either a list of rules or a
+    string of rules separated by whitespace or commas, as in the tracking
+    domain fields. Matchers are compiled once per process.
+    """
+    if isinstance(domains, basestring):
+        domains = domains.replace(',', ' ').split()
+    domains = tuple(domains)
+    if domains not in _domain_matchers:
+        if len(_domain_matchers) >= 256:
+            _domain_matchers.clear()
+        _domain_matchers[domains] = DomainMatcher(domains)
+    return _domain_matchers[domains]
+
 def track_document(html, domain=None, campaign=None, source='newsletter', medium='email'):
     """
     Loops over a bundle of HTML and tracks any links contained therein.
 
-    :param html: An HTML string that will be parsed for links.
-    :param domain: A string representation of the domain for which links should be tracked.
+    :param html: An HTML string that will be parsed for links. If a parsed document
+        is passed it is modified in place and returned.
+    :param domain: The domains for which links should be tracked, as a list or a string
+        separated by whitespace or commas (see DomainMatcher), or a DomainMatcher.
     :param campaign: Use to identify a sepcific product promotion or campaign.
     :param source: Use to identify a search engine, newsletter name, or other source.
     :param medium: Use to identify a medium such as email or cost-per-click.
 
     :return: The tracked document is returned as a unicode string.
     """
-    soup = BeautifulSoup(html)
+    soup = parse_html(html)
     anchors = soup.findAll('a')
 
     if not domain:
         domain = Site.objects.get_current().domain
+    matcher = domain if isinstance(domain, DomainMatcher) else get_domain_matcher(domain)
+
+    # Newsletters repeat the same links, so each url is only parsed and matched once
+    tracked_urls = {}
 
     tracking_args = {
         'utm_campaign': campaign,
@@ -134,19 +446,20 @@ def track_document(html, domain=None, campaign=None, source='newsletter', medium
             
             # Skip links that have already been tracked
             if TRACKED_LINK_CLASS not in anchor_css_class:
-                if anchor.has_key('href'):
+                if anchor.get('href') is not None:
                     url = anchor['href']
                     url = url.strip()
-                    parsed_url = urlparse(url)
-
-                    # Only track links from specific domains
-                    # :todo: Make this comparison smarter
-                    if domain in parsed_url.netloc:
-                        # Append appropriate query prefix to url
-                        if not parsed_url.query:
-                            url += '?'
+
+                    if url not in tracked_urls:
+                        parsed_url = urlparse(url)
+                        # Only track links from specific domains, with the query prefix to append
+                        if matcher.match(parsed_url.netloc):
+                            tracked_urls[url] = '&' if parsed_url.query else '?'
                         else:
-                            url += '&'
+                            tracked_urls[url] = None
+
+                    if tracked_urls[url] is not None:
+                        url += tracked_urls[url]
 
                         # Generate term that is unique per anchor and include alttext for readability
                         tracking_args['utm_term'] = '{source}-{index}-{alttext}'.format(source=source,
@@ -162,4 +475,6 @@ def track_document(html, domain=None, campaign=None, source='newsletter', medium
             # TODO: Log the error
             pass
 
+    if soup is html:
+        return soup
     return smart_str(soup)
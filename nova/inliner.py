@@ -0,0 +1,304 @@
+"""
+A pure Python CSS inliner, used in place of the external premailer script
+when NOVA_PREMAILER_ENGINE is set to 'python'.
+
+The <style> blocks of a document are parsed once and their selectors are
+compiled into matchers, indexed by the id, class or tag name their rightmost
+compound selector requires. Styles are then applied in a single walk over the
+document. Rules that can't be inlined (at-rules such as @media, and selectors
+with pseudo-classes or pseudo-elements) are left in a <style> block.
+
+Supported selectors are type, universal, class, id and attribute ([attr],
+[attr=value], [attr~=value]) selectors, joined by descendant or child
+combinators.
+"""
+import re
+
+from django.utils.encoding import smart_str
+
+from nova.helpers import parse_html
+
+# The number of compiled stylesheets kept in memory, keyed by their source
+STYLESHEET_CACHE_SIZE = 32
+
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+# The <!-- --> stylesheets are wrapped in for old clients, which CSS ignores
+HTML_COMMENT_RE = re.compile(r'<!--|-->')
+COMPOUND_RE = re.compile(r'^(?P<tag>\*|[a-zA-Z][\w-]*)?(?P<rest>(?:[.#][\w-]+|\[[^\]]+\])*)$')
+PART_RE = re.compile(r'[.#][\w-]+|\[[^\]]+\]')
+ATTRIBUTE_RE = re.compile(r'^\[\s*([\w-]+)\s*(?:(~?=)\s*["\']?(.*?)["\']?\s*)?\]$')
+COMBINATOR_RE = re.compile(r'\s*>\s*|\s+')
+DECLARATION_SPLIT_RE = re.compile(r';(?![^(]*\))')
+
+class UnsupportedSelector(Exception):
+    """
+    Exception thrown when a selector can't be inlined
+    """
+
+def _classes(tag):
+    return (tag.get('class') or '').split()
+
+def _compile_compound(compound):
+    """
+    Compile a compound selector (e.g. 'p.intro#first') into a predicate and
+    its (ids, classes, tags) specificity. Also returns the most selective
+    (kind, value) key for indexing.
+    """
+    match = COMPOUND_RE.match(compound)
+    if not match:
+        raise UnsupportedSelector(compound)
+
+    tests = []
+    ids = classes = tags = 0
+    key = ('*', None)
+
+    tag_name = match.group('tag')
+    if tag_name and tag_name != '*':
+        tag_name = tag_name.lower()
+        tests.append(lambda tag, name=tag_name: tag.name == name)
+        tags += 1
+        key = ('tag', tag_name)
+
+    for part in PART_RE.findall(match.group('rest')):
+        if part[0] == '#':
+            tests.append(lambda tag, value=part[1:]: tag.get('id') == value)
+            ids += 1
+            key = ('id', part[1:])
+        elif part[0] == '.':
+            tests.append(lambda tag, value=part[1:]: value in _classes(tag))
+            classes += 1
+            if key[0] != 'id':
+                key = ('class', part[1:])
+        else:
+            attribute = ATTRIBUTE_RE.match(part)
+            if not attribute:
+                raise UnsupportedSelector(compound)
+            name, operator, value = attribute.groups()
+            if operator is None:
+                tests.append(lambda tag, name=name: tag.get(name) is not None)
+            elif operator == '=':
+                tests.append(lambda tag, name=name, value=value: tag.get(name) == value)
+            else:
+                tests.append(lambda tag, name=name, value=value: value in (tag.get(name) or '').split())
+            classes += 1
+
+    def predicate(tag):
+        for test in tests:
+            if not test(tag):
+                return False
+        return True
+
+    return predicate, (ids, classes, tags), key
+
+class Selector(object):
+    """
+    A compiled complex selector, matched from right to left.
+    """
+    def __init__(self, text):
+        self.text = text.strip()
+        if not self.text or ':' in self.text:
+            raise UnsupportedSelector(self.text)
+
+        compounds = COMBINATOR_RE.split(self.text)
+        combinators = [c.strip() or ' ' for c in COMBINATOR_RE.findall(self.text)]
+
+        self.steps = []
+        specificity = [0, 0, 0]
+        for index, compound in enumerate(compounds):
+            predicate, compound_specificity, key = _compile_compound(compound)
+            specificity = [a + b for a, b in zip(specificity, compound_specificity)]
+            self.steps.append((predicate, combinators[index - 1] if index else None))
+
+        self.specificity = tuple(specificity)
+        self.key = key
+        self.steps.reverse()
+
+    def _match(self, tag, step):
+        predicate, combinator = self.steps[step]
+        if not predicate(tag):
+            return False
+        if step + 1 == len(self.steps):
+            return True
+
+        # The combinator joining this compound to the one on its left
+        parent = tag.parent
+        if combinator == '>':
+            return parent is not None and parent.name != '[document]' and self._match(parent, step + 1)
+
+        while parent is not None and parent.name != '[document]':
+            if self._match(parent, step + 1):
+                return True
+            parent = parent.parent
+        return False
+
+    def matches(self, tag):
+        return self._match(tag, 0)
+
+def parse_declarations(text):
+    """
+    Parse a block of CSS declarations into a list of
+    (property, value, important) tuples.
+    """
+    declarations = []
+    for declaration in DECLARATION_SPLIT_RE.split(text):
+        if ':' not in declaration:
+            continue
+        prop, value = declaration.split(':', 1)
+        prop, value = prop.strip().lower(), value.strip()
+        important = value.lower().endswith('!important')
+        if important:
+            value = value[:-len('!important')].strip()
+        if prop and value:
+            declarations.append((prop, value, important))
+    return declarations
+
+def _split_blocks(css):
+    """
+    Split a stylesheet into (prelude, body) pairs, keeping nested at-rule
+    blocks such as @media together.
+    """
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = None
+    for index, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:index]
+                start = index + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude.strip(), css[start:index]))
+                start = index + 1
+    return blocks
+
+class Stylesheet(object):
+    """
+    The rules of a document's <style> blocks, compiled for inlining.
+    """
+    def __init__(self, css):
+        self.rules = {}
+        self.leftover = []
+
+        css = COMMENT_RE.sub('', HTML_COMMENT_RE.sub('', css))
+        order = 0
+        for prelude, body in _split_blocks(css):
+            if prelude.startswith('@'):
+                self.leftover.append('%s {%s}' % (prelude, body))
+                continue
+
+            declarations = parse_declarations(body)
+            for text in prelude.split(','):
+                try:
+                    selector = Selector(text)
+                except UnsupportedSelector:
+                    self.leftover.append('%s {%s}' % (text.strip(), body))
+                    continue
+
+                order += 1
+                self.rules.setdefault(selector.key, []).append((selector, order, declarations))
+
+    def matching_rules(self, tag):
+        """
+        Return the (selector, order, declarations) rules matching tag.
+        """
+        candidates = list(self.rules.get(('*', None), []))
+        candidates.extend(self.rules.get(('tag', tag.name), []))
+        if tag.get('id'):
+            candidates.extend(self.rules.get(('id', tag['id']), []))
+        for css_class in _classes(tag):
+            candidates.extend(self.rules.get(('class', css_class), []))
+
+        return [rule for rule in candidates if rule[0].matches(tag)]
+
+    def computed_style(self, tag):
+        """
+        Return the style attribute for tag, cascading matching rules by
+        importance, specificity and order, with the tag's own style
+        overriding everything but !important rules.
+        """
+        cascade = []
+        for selector, order, declarations in self.matching_rules(tag):
+            for prop, value, important in declarations:
+                cascade.append(((important, 0, selector.specificity, order), prop, value))
+
+        if not cascade:
+            return None
+
+        for prop, value, important in parse_declarations(tag.get('style') or ''):
+            cascade.append(((important, 1, (0, 0, 0), 0), prop, value))
+
+        properties = []
+        values = {}
+        for priority, prop, value in sorted(cascade, key=lambda entry: entry[0]):
+            if prop not in values:
+                properties.append(prop)
+            values[prop] = value
+
+        return ' '.join(['%s: %s;' % (prop, values[prop]) for prop in properties])
+
+_stylesheets = {}
+
+def get_stylesheet(css):
+    """
+    Return a compiled Stylesheet for css, reusing an earlier compilation
+    of identical css.
+    """
+    if css not in _stylesheets:
+        if len(_stylesheets) >= STYLESHEET_CACHE_SIZE:
+            _stylesheets.clear()
+        _stylesheets[css] = Stylesheet(css)
+    return _stylesheets[css]
+
+def _style_text(style):
+    """
+    Return the css of a <style> block. BeautifulSoup 3 parses a stylesheet
+    wrapped in <!-- --> as a comment, so its text is used as is.
+    """
+    return ''.join(['<!--%s-->' % c[:] if c.__class__.__name__ == 'Comment' else unicode(c)
+            for c in style.contents])
+
+def inline_soup(soup):
+    """
+    Inline the <style> blocks of a parsed document in place.
+    """
+    styles = soup.findAll('style')
+    css = '\n'.join([_style_text(style) for style in styles
+            if (style.get('media') or 'all') in ('all', 'screen')])
+    if not css.strip():
+        return soup
+
+    stylesheet = get_stylesheet(css)
+
+    for tag in soup.findAll(True):
+        style = stylesheet.computed_style(tag)
+        if style:
+            tag['style'] = style
+
+    # Drop the inlined rules, keeping anything that couldn't be inlined
+    inlined = [style for style in styles if (style.get('media') or 'all') in ('all', 'screen')]
+    for style in inlined[1:]:
+        style.extract()
+    if stylesheet.leftover:
+        for child in list(inlined[0].contents):
+            child.extract()
+        leftover = '\n%s\n' % '\n'.join(stylesheet.leftover)
+        if '<!--' in css:
+            # Keep hiding the rules from clients that would show them as text
+            leftover = '<!--%s-->' % leftover
+        inlined[0].insert(0, leftover)
+    else:
+        inlined[0].extract()
+
+    return soup
+
+def inline_css(html):
+    """
+    Inline the <style> blocks of an HTML document into style attributes.
+
+    :param html: The document to inline.
+    :return: The inlined document as a UTF-8 bytestring.
+    """
+    return smart_str(inline_soup(parse_html(html)))
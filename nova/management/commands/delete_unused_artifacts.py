@@ -0,0 +1,15 @@
+"""
+A command to delete rendered artifacts that no issue uses any more
+"""
+from django.core.management.base import BaseCommand
+from django.contrib.humanize.templatetags.humanize import intcomma
+
+from nova.models import RenderedArtifact
+
+class Command(BaseCommand):
+    help = "Delete stored renders of newsletter issues that no issue refers to any more, e.g. after templates were edited."
+
+    def handle(self, *args, **options):
+        deleted = RenderedArtifact.objects.delete_unused()
+
+        print "Deleted %s unused rendered artifacts." % (intcomma(deleted),)
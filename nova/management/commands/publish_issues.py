@@ -0,0 +1,28 @@
+"""
+A command to publish sent issues to the static web archive
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.humanize.templatetags.humanize import intcomma
+
+from nova import archive
+from nova.models import NewsletterIssue
+
+class Command(BaseCommand):
+    args = '[issue_id issue_id ...]'
+    help = "Publish sent newsletter issues (or the given issues) to NOVA_ARCHIVE_DIR. Issues are also published whenever they are sent."
+
+    def handle(self, *args, **options):
+        if not archive.get_archive_dir():
+            raise CommandError("NOVA_ARCHIVE_DIR is not set.")
+
+        if args:
+            issues = NewsletterIssue.objects.filter(pk__in=args)
+        else:
+            issues = NewsletterIssue.objects.filter(sent_at__isnull=False)
+
+        published = 0
+        for issue in issues:
+            issue.publish()
+            published += 1
+
+        print "Published %s issues." % (intcomma(published),)
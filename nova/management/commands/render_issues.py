@@ -0,0 +1,28 @@
+"""
+A command to render newsletter issues whose rendered artifacts are out of date
+"""
+from django.core.management.base import BaseCommand
+from django.contrib.humanize.templatetags.humanize import intcomma
+
+from nova.models import NewsletterIssue, RENDER_RENDERED
+
+class Command(BaseCommand):
+    args = '[issue_id issue_id ...]'
+    help = "Render newsletter issues (or the given issues) that are not rendered yet, e.g. because their background render was lost."
+
+    def handle(self, *args, **options):
+        if args:
+            issues = NewsletterIssue.objects.filter(pk__in=args)
+        else:
+            issues = NewsletterIssue.objects.exclude(render_status=RENDER_RENDERED).exclude(template='')
+
+        rendered = failed = 0
+        for issue in issues:
+            try:
+                issue.render_artifacts()
+                rendered += 1
+            except Exception, e:
+                print "Failed to render issue %s: %s" % (issue.pk, e)
+                failed += 1
+
+        print "Rendered %s issues, %s failed." % (intcomma(rendered), intcomma(failed))
@@ -0,0 +1,18 @@
+"""
+A command to resume sends that were paused by a volume quota or a failing stage
+"""
+from django.core.management.base import BaseCommand
+from django.contrib.humanize.templatetags.humanize import intcomma
+
+from nova.models import NewsletterIssue
+from nova.scheduler import send_issues
+
+class Command(BaseCommand):
+    help = "Resume sending newsletter issues that were paused because a volume quota was used up or a stage kept failing. Run this periodically (e.g. hourly from cron)."
+
+    def handle(self, *args, **options):
+        issues = list(NewsletterIssue.objects.filter(send_paused=True))
+
+        sent = send_issues(issues, resume=True, mark_as_sent=False)
+
+        print "Sent %s messages for %s paused issues." % (intcomma(sent), intcomma(len(issues)))
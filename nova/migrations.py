@@ -247,3 +247,113 @@ class AddDefaultTrackingDomainField(SqlMigration):
 
     class Meta:
         model = Newsletter
+
+class AddNewsletterIssueNewslettersTable(SqlMigration):
+    """
+    Create the join table for the newsletters field on the
+    NewsletterIssue model.
+    """
+    sql = """\
+    CREATE TABLE nova_newsletterissue_newsletters (
+        id serial NOT NULL PRIMARY KEY,
+        newsletterissue_id integer NOT NULL REFERENCES nova_newsletterissue (id) DEFERRABLE INITIALLY DEFERRED,
+        newsletter_id integer NOT NULL REFERENCES nova_newsletter (id) DEFERRABLE INITIALLY DEFERRED,
+        UNIQUE (newsletterissue_id, newsletter_id)
+    )"""
+
+class AddSendPriorityField(SqlMigration):
+    """
+    Add the send_priority field to the Newsletter model.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN send_priority integer NOT NULL DEFAULT 1 CHECK (send_priority >= 0)"""
+
+    class Meta:
+        model = Newsletter
+
+class AddSendStateFields(SqlMigration):
+    """
+    Add the send_paused and send_cursor fields to the
+    NewsletterIssue model.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN send_paused boolean NOT NULL DEFAULT False,
+    ADD COLUMN send_cursor integer DEFAULT NULL CHECK (send_cursor >= 0)"""
+
+    class Meta:
+        model = NewsletterIssue
+
+class AddRenderedArtifactFields(SqlMigration):
+    """
+    Add the rendered_plaintext and rendered_hash fields to the
+    NewsletterIssue model.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN rendered_plaintext text DEFAULT NULL,
+    ADD COLUMN rendered_hash varchar(40) NOT NULL DEFAULT ''"""
+
+    class Meta:
+        model = NewsletterIssue
+
+class AddRenderedAtField(SqlMigration):
+    """
+    Add the rendered_at field to the NewsletterIssue model.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN rendered_at timestamp with time zone DEFAULT NULL"""
+
+    class Meta:
+        model = NewsletterIssue
+
+class MoveRenderedArtifacts(SqlMigration):
+    """
+    Replace the rendered_template and rendered_plaintext fields on the
+    NewsletterIssue model with keys into the RenderedArtifact table.
+    Issues without keys are re-rendered into that table the next time
+    they are saved, sent or previewed.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN rendered_html_key varchar(40) NOT NULL DEFAULT '',
+    ADD COLUMN rendered_plaintext_key varchar(40) NOT NULL DEFAULT '',
+    DROP COLUMN rendered_template,
+    DROP COLUMN rendered_plaintext"""
+
+    class Meta:
+        model = NewsletterIssue
+        requires = [AddRenderedArtifactFields,]
+
+class AddRenderStatusFields(SqlMigration):
+    """
+    Add the render_status, render_version and render_error fields to the
+    NewsletterIssue model. Existing issues start out stale and are brought
+    up to date the next time they are saved, sent or previewed.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN render_status varchar(10) NOT NULL DEFAULT 'stale',
+    ADD COLUMN render_version integer NOT NULL DEFAULT 0 CHECK (render_version >= 0),
+    ADD COLUMN render_error text NOT NULL DEFAULT ''"""
+
+    class Meta:
+        model = NewsletterIssue
+        requires = [MoveRenderedArtifacts,]
+
+class AddRenderQueryFields(SqlMigration):
+    """
+    Add the render_queries, render_query_time and render_query_report
+    fields to the NewsletterIssue model.
+    """
+    sql = """\
+    ALTER TABLE {table}
+    ADD COLUMN render_queries integer DEFAULT NULL CHECK (render_queries >= 0),
+    ADD COLUMN render_query_time double precision DEFAULT NULL,
+    ADD COLUMN render_query_report text NOT NULL DEFAULT ''"""
+
+    class Meta:
+        model = NewsletterIssue
+        requires = [AddRenderStatusFields,]
@@ -0,0 +1,134 @@
+"""
+HTML minification for premailed newsletter issues, enabled with NOVA_MINIFY_HTML.
+
+Minification runs after CSS has been inlined and only makes changes that email
+clients can't tell apart from the original:
+    - comments are removed, except conditional comments ("<!--[if mso]>") and
+      the comments stylesheets and scripts are commonly wrapped in
+    - runs of whitespace in text are collapsed to a single space, or to a single
+      newline if they contain one (keeping lines short for SMTP), except inside
+      <pre> and <textarea>, and whitespace between table rows, cells and list
+      items is dropped
+    - repeated identical declarations in style attributes are dropped; repeated
+      properties with different values are kept, since they are often fallbacks
+      for clients that don't understand the later value
+    - comments and redundant whitespace are removed from <style> blocks
+
+project specific settings:
+NOVA_MINIFY_HTML:
+    If True, minify issues when they are premailed. Defaults to False.
+"""
+import logging
+import re
+
+from django.utils.encoding import smart_str
+
+from nova.helpers import parse_html
+
+logger = logging.getLogger('nova.minify')
+
+PRESERVE_WHITESPACE_TAGS = frozenset(('pre', 'textarea'))
+STRUCTURAL_TAGS = frozenset(('html', 'head', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'ul', 'ol', 'select'))
+
+# Strings that are left as they are
+SKIPPED_STRINGS = frozenset(('CData', 'Declaration', 'Doctype', 'ProcessingInstruction'))
+
+WHITESPACE_RE = re.compile(r'\s+')
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,])\s*')
+
+def _is_comment(node):
+    return node.__class__.__name__ == 'Comment'
+
+def _is_conditional_comment(text):
+    return text.lstrip().startswith('[if') or '<![endif]' in text
+
+def _collapse_whitespace(match):
+    return '\n' if '\n' in match.group(0) else ' '
+
+def _in_tags(node, names):
+    parent = node.parent
+    while parent is not None:
+        if getattr(parent, 'name', None) in names:
+            return True
+        parent = parent.parent
+    return False
+
+def minify_css(css):
+    """
+    Remove comments and redundant whitespace from a stylesheet.
+    """
+    css = CSS_COMMENT_RE.sub('', css)
+    css = WHITESPACE_RE.sub(' ', css)
+    return CSS_PUNCTUATION_RE.sub(r'\1', css).strip()
+
+def minify_style_attribute(style):
+    """
+    Remove repeated identical declarations and redundant whitespace from
+    the value of a style attribute.
+    """
+    declarations = []
+    seen = set()
+    for declaration in re.split(r';(?![^(]*\))', style):
+        if ':' not in declaration:
+            continue
+        prop, value = declaration.split(':', 1)
+        declaration = '%s:%s' % (prop.strip().lower(), WHITESPACE_RE.sub(' ', value.strip()))
+        if declaration not in seen:
+            seen.add(declaration)
+            declarations.append(declaration)
+    return ';'.join(declarations)
+
+def minify_soup(soup):
+    """
+    Minify a parsed document in place and return it.
+    """
+    for text in soup.findAll(text=True):
+        if _is_comment(text):
+            parent_name = getattr(text.parent, 'name', None)
+            if parent_name == 'style':
+                # A stylesheet wrapped in <!-- --> for old clients, keep the wrapper
+                minified = minify_css(text[:])
+                if minified != text[:]:
+                    text.replaceWith(text.__class__(minified))
+            elif parent_name != 'script' and not _is_conditional_comment(text):
+                text.extract()
+            continue
+        if text.__class__.__name__ in SKIPPED_STRINGS:
+            continue
+
+        parent_name = getattr(text.parent, 'name', None)
+        if parent_name == 'style':
+            minified = minify_css(unicode(text))
+        elif parent_name == 'script' or _in_tags(text, PRESERVE_WHITESPACE_TAGS):
+            continue
+        elif parent_name in STRUCTURAL_TAGS and not text.strip():
+            text.extract()
+            continue
+        else:
+            minified = WHITESPACE_RE.sub(_collapse_whitespace, unicode(text))
+
+        if minified != unicode(text):
+            text.replaceWith(minified)
+
+    for tag in soup.findAll(style=True):
+        tag['style'] = minify_style_attribute(tag['style'])
+
+    return soup
+
+def minify_html(html):
+    """
+    Minify an HTML document and log its size before and after.
+
+    :param html: The document to minify, either a string or a parsed document,
+        which is minified in place.
+    :return: The minified document as a UTF-8 bytestring.
+    """
+    before = len(smart_str(html))
+    minified = smart_str(minify_soup(parse_html(html)))
+
+    if before:
+        logger.info('Minified html from %d to %d bytes (%.1f%% smaller)', before, len(minified),
+                100.0 * (before - len(minified)) / before)
+
+    return minified
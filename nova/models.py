@@ -8,26 +8,103 @@ NOVA_CONTEXT_PROCESSORS:
     when NewsletterIssues render themselves, just before they are sent.  Each function must accept
     the following arguments:
         newsletter_issue: NewsletterIssue instance that is sending the email
-        email: EmailAddress instance that is receiving the email
+    and return a dictionary of extra context. The rendered issue is shared by every recipient.
+    The processors are imported the first time an issue renders; a bad path raises
+    ImproperlyConfigured. Slow processors that don't depend on the others can be marked with
+    nova.context.independent to run concurrently, with their results memoized per issue.
+NOVA_RECIPIENT_CONTEXT_PROCESSORS:
+    defines a list of functions that add per recipient context, for issues that are personalized.
+    When any are configured, each recipient's copy of an issue is rendered with the recipient as
+    'email' plus the context the processors return for them. Processors are called once per chunk
+    of recipients, so they can fetch what they need in bulk, with the following arguments:
+        newsletter_issue: NewsletterIssue instance that is sending the email
+        email_addresses: a list of the EmailAddress instances in the chunk
+    and return a dictionary mapping EmailAddress primary keys to dictionaries of extra context.
+    NOVA_CONTEXT_PROCESSORS and the premail transforms only run once per send, and recipients
+    whose copies render identically share one premailed copy.
+NOVA_RECIPIENT_CHUNK_SIZE:
+    The number of recipients passed to NOVA_RECIPIENT_CONTEXT_PROCESSORS at once. Defaults to 500.
+NOVA_TEMPLATE_CACHE_SIZE:
+    The number of compiled issue templates kept in memory. Defaults to 64.
+NOVA_CONTEXT_VERSION:
+    An arbitrary string that is part of the hash stored with an issue's rendered html and
+    plaintext. Change it to re-render issues whose context processors return new content.
 """
+import atexit
+import base64
+import time
+import traceback
+import zlib
 from datetime import datetime
 from subprocess import Popen, PIPE
 
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import F
 from django.forms import ValidationError
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
-from django.core.mail import send_mail, EmailMessage
+from django.core.mail import send_mail, EmailMessage, get_connection
 from django.core.validators import email_re
 from django.utils.translation import ugettext_lazy as _
-from django.template import Context, Template
-from django.utils.encoding import smart_str
-
-from nova.helpers import track_document, canonicalize_links, send_multipart_mail, PremailerException, get_raw_template
+from django.template import Context
+from django.utils.encoding import smart_str, smart_unicode
+
+from nova.helpers import chunks, track_document, canonicalize_links, send_multipart_mail, PremailerException, get_raw_template, \
+        get_premailer_version, parse_html, get_callables, compile_template
+from nova.signing import get_signer
+from nova.cache import get_premailer_cache, content_key, LRUCache
+from nova.workers import get_premailer_pool
+from nova.plaintext import html_to_text
+from nova.inliner import inline_soup
+from nova.minify import minify_html
+from nova.tracking import BufferedCounter, track_clicks, add_open_pixel, get_open_pixel_url, \
+        personalize_open_pixel, remove_open_pixel
+from nova import archive
+from nova.context import run_context_processors
+from nova.rendering import RenderQueue
+from nova.queries import QueryRecorder, check_budget
+from nova.budgets import StageTimeout, StageUnavailable, get_budget, get_breaker, communicate, run_stage
+from nova.warmup import get_quota_limits, get_windows, DAY, HOUR
 
 TOKEN_LENGTH = 12
 
+RENDER_STALE = 'stale'
+RENDER_RENDERING = 'rendering'
+RENDER_RENDERED = 'rendered'
+RENDER_FAILED = 'failed'
+RENDER_STATUS_CHOICES = (
+    (RENDER_STALE, _('Stale')),
+    (RENDER_RENDERING, _('Rendering')),
+    (RENDER_RENDERED, _('Rendered')),
+    (RENDER_FAILED, _('Failed')),
+)
+
+# NewsletterIssue fields that change without changing what the issue renders to, or never change
+ARTIFACT_HASH_EXCLUDED_FIELDS = frozenset(('rendered_html_key', 'rendered_plaintext_key', 'rendered_hash',
+    'rendered_at', 'render_status', 'render_version', 'render_error', 'render_queries', 'render_query_time',
+    'render_query_report', 'sent_at', 'send_paused', 'send_cursor', 'created_at'))
+
+def _field_values(instance, exclude=()):
+    """
+    Return a string of the values of instance's fields, the same whether
+    the instance was loaded from the database or built in memory.
+    """
+    return repr([(field.attname, smart_unicode(field.to_python(getattr(instance, field.attname))))
+            for field in instance._meta.fields if field.attname not in exclude])
+
+# The stages of nova.budgets that premail transforms belong to
+TRANSFORM_STAGES = {
+    canonicalize_links: 'canonicalize',
+    track_document: 'track',
+    track_clicks: 'track',
+    add_open_pixel: 'track',
+}
+
+# The number of distinct personalized renders of an issue premailed once each during a send
+PERSONALIZED_CACHE_SIZE = 32
+
 def _sanitize_email(email):
     return email.strip().lower()
 
@@ -191,7 +268,9 @@ class Newsletter(models.Model):
     default_template = models.CharField(max_length=255, blank=True,
         help_text=_("The name of a default template to use for issues of this newsletter."))
     default_tracking_domain = models.CharField(max_length=255, blank=True,
-            help_text=_("A domain for which links should be tracked. Used as the default value for the tracking domain field on an issue of this newsletter."))
+            help_text=_("The domains for which links should be tracked, separated by spaces or commas. Used as the default value for the tracking domain field on an issue of this newsletter."))
+    send_priority = models.PositiveIntegerField(default=1,
+            help_text=_("When several issues are sent at once, the number of messages sent for issues of this newsletter in each scheduling turn. Raise it to let a small, important list finish first."))
     created_at = models.DateTimeField(auto_now_add=True)
 
     subscriptions = models.ManyToManyField(EmailAddress, through='Subscription')
@@ -224,26 +303,52 @@ class NewsletterIssue(models.Model):
     line and template that will be sent out to subscribers.
     """
     newsletter = models.ForeignKey(Newsletter)
+    newsletters = models.ManyToManyField(Newsletter, blank=True, related_name='shared_issues',
+        help_text=_("Additional newsletters whose subscribers should also receive this issue. Subscribers of more than one newsletter will only receive the issue once."))
     subject = models.CharField(max_length=255, null=False, blank=False)
     template = models.TextField(null=False, blank=True,
         help_text=_("If template is left empty we'll use the default template from the parent newsletter."))
-    rendered_template = models.TextField(null=True, blank=True)
+    rendered_html_key = models.CharField(max_length=40, blank=True, editable=False,
+        help_text=_("The RenderedArtifact holding the premailed html of this issue."))
+    rendered_plaintext_key = models.CharField(max_length=40, blank=True, editable=False,
+        help_text=_("The RenderedArtifact holding the plaintext of this issue."))
+    rendered_hash = models.CharField(max_length=40, blank=True, editable=False,
+        help_text=_("A hash of the inputs the rendered template and plaintext were built from."))
+    rendered_at = models.DateTimeField(null=True, blank=True, editable=False)
+    render_status = models.CharField(max_length=10, choices=RENDER_STATUS_CHOICES, default=RENDER_STALE,
+        editable=False, help_text=_("Whether the rendered template and plaintext are up to date."))
+    render_version = models.PositiveIntegerField(default=0, editable=False,
+        help_text=_("The number of times this issue has been saved for rendering."))
+    render_error = models.TextField(blank=True, editable=False,
+        help_text=_("The error of the last failed render."))
+    render_queries = models.PositiveIntegerField(null=True, blank=True, editable=False,
+        help_text=_("The number of database queries the last render ran."))
+    render_query_time = models.FloatField(null=True, blank=True, editable=False,
+        help_text=_("The number of seconds the queries of the last render took."))
+    render_query_report = models.TextField(blank=True, editable=False,
+        help_text=_("The most repeated queries of the last render."))
     
     track = models.BooleanField(default=True,
         help_text=_("Add link tracking to all links from this domain."))
     tracking_domain = models.CharField(max_length=255, blank=True, 
-        help_text=_("The domain for which links should be tracked."))
+        help_text=_("The domains for which links should be tracked, separated by spaces or commas. A domain also covers its subdomains; use '*.example.com' to only track subdomains."))
     tracking_campaign = models.CharField(max_length=20, blank=True, 
         help_text=_("A short keyword to identify this campaign (e.g. 'DHD')."))
 
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(blank=True, null=True,
             help_text=_("When this newsletter issue was last sent to subscribers."))
+    send_paused = models.BooleanField(default=False,
+            help_text=_("Whether sending this issue was paused because a volume quota was used up."))
+    send_cursor = models.PositiveIntegerField(null=True, blank=True,
+            help_text=_("The primary key of the last recipient this issue was sent to while volume quotas are in effect."))
 
     def save(self, *args, **kwargs):
         """
         If template is blank and the parent newsletter has a default
-        template, load that default from disk.
+        template, load that default from disk. The issue is then rendered,
+        or queued to be rendered in the background if NOVA_BACKGROUND_RENDERING
+        is set (see nova.rendering).
         """
         if not self.template:
             if self.newsletter.default_template:
@@ -256,13 +361,210 @@ class NewsletterIssue(models.Model):
             if self.newsletter.default_tracking_domain:
                 self.tracking_domain = self.newsletter.default_tracking_domain
 
+        background = getattr(settings, 'NOVA_BACKGROUND_RENDERING', False)
+        if self.template:
+            self.render_version += 1
+            self.render_status = RENDER_STALE
+
         super(NewsletterIssue, self).save(*args, **kwargs)
 
-        if self.template:
-            html_template, _ = self.premail(track=self.track, plaintext=False,
-                    template=self.render())
-            self.rendered_template = html_template
-            super(NewsletterIssue, self).save()
+        if self.template and background:
+            get_render_queue().add(self.pk, self.render_version)
+        elif self.template:
+            self.render_artifacts()
+
+    @property
+    def recipients(self):
+        """
+        Return a de-duplicated queryset of confirmed subscribers to the parent
+        newsletter and any additional newsletters this issue targets. Duplicates
+        are removed by the database with a DISTINCT and the queryset is ordered by
+        primary key so repeated iterations visit addresses in a stable order.
+        """
+        newsletter_ids = [self.newsletter_id]
+        if self.pk:
+            newsletter_ids.extend(self.newsletters.values_list('pk', flat=True))
+
+        return EmailAddress.objects.filter(confirmed=True,
+                subscriptions__newsletter__in=newsletter_ids).distinct().order_by('pk')
+
+    def get_artifact_hash(self):
+        """
+        Return a hash of everything the rendered artifacts depend on: the
+        fields of the issue and of its newsletters (which templates can read
+        through the 'issue' context variable), the current site and the
+        settings that affect rendering and premailing. The fields recording
+        the rendered artifacts and the progress of sends are left out, since
+        they change without changing what is rendered. Projects whose context
+        processors return changing content can bump NOVA_CONTEXT_VERSION to
+        invalidate previously rendered artifacts.
+        """
+        use_premailer = getattr(settings, 'NOVA_USE_PREMAILER', False)
+        engine = getattr(settings, 'NOVA_PREMAILER_ENGINE', 'premailer')
+        if use_premailer and engine != 'python':
+            engine = '%s %s' % (engine, get_premailer_version())
+
+        newsletters = [self.newsletter]
+        if self.pk is not None:
+            newsletters.extend(self.newsletters.order_by('pk'))
+
+        return content_key(_field_values(self, exclude=ARTIFACT_HASH_EXCLUDED_FIELDS),
+                ' '.join([_field_values(newsletter, exclude=('created_at',)) for newsletter in newsletters]),
+                Site.objects.get_current().domain,
+                use_premailer, engine, getattr(settings, 'NOVA_CLICK_TRACKING', False),
+                getattr(settings, 'NOVA_OPEN_TRACKING', False), getattr(settings, 'NOVA_MINIFY_HTML', False),
+                ' '.join(getattr(settings, 'NOVA_CONTEXT_PROCESSORS', ())),
+                ' '.join(getattr(settings, 'NOVA_PREMAIL_TRANSFORMS', ())),
+                getattr(settings, 'NOVA_CONTEXT_VERSION', ''))
+
+    def get_artifacts(self):
+        """
+        Return the (html, plaintext) pair this issue is mailed as. The pair is
+        stored with a hash of its inputs and only rendered and premailed
+        again once that hash changes.
+        """
+        artifact_hash = self.get_artifact_hash()
+        if self.rendered_hash != artifact_hash or not self.rendered_html_key:
+            html, plaintext = self.premail(track=self.track, template=self.render(record_queries=True))
+            html_key = RenderedArtifact.objects.store(html)
+            plaintext_key = RenderedArtifact.objects.store(plaintext)
+
+            # Artifacts premailed by the fallback are replaced the next time they're needed
+            if self.__dict__.pop('_premailer_fallback', False):
+                artifact_hash = ''
+
+            # Store the artifacts, and the queries rendering them took, without saving (and re-rendering) the issue
+            fields = {}
+            stats = self.__dict__.pop('_query_stats', None)
+            if stats is not None:
+                fields = {'render_queries': stats.count, 'render_query_time': stats.time,
+                        'render_query_report': stats.report()}
+            self._update_send_state(rendered_html_key=html_key, rendered_plaintext_key=plaintext_key,
+                    rendered_hash=artifact_hash, rendered_at=datetime.now(), **fields)
+            self._artifacts = {html_key: smart_unicode(html), plaintext_key: smart_unicode(plaintext)}
+
+        return (self.rendered_template, self.rendered_plaintext)
+
+    def render_artifacts(self):
+        """
+        Bring this issue's rendered artifacts up to date, like get_artifacts(),
+        and record the outcome as its render status. The status is only recorded
+        if the issue hasn't been saved again in the meantime.
+        """
+        version = self.render_version
+        self._update_render_status(version, RENDER_RENDERING)
+        try:
+            artifacts = self.get_artifacts()
+        except Exception:
+            self._update_render_status(version, RENDER_FAILED, traceback.format_exc())
+            raise
+
+        self._update_render_status(version, RENDER_RENDERED)
+        return artifacts
+
+    def _update_render_status(self, version, status, error=''):
+        if NewsletterIssue.objects.filter(pk=self.pk, render_version=version).update(
+                render_status=status, render_error=error):
+            self.render_status = status
+            self.render_error = error
+
+    def wait_for_render(self, timeout=None):
+        """
+        Return this issue's rendered artifacts, waiting up to timeout seconds
+        (NOVA_RENDER_WAIT by default) for a background render in progress and
+        rendering the issue on this thread if the artifacts are still stale.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'NOVA_RENDER_WAIT', 60)
+
+        deadline = time.time() + timeout
+        while self.render_status == RENDER_RENDERING and time.time() < deadline:
+            time.sleep(0.1)
+            self._refresh_render_state()
+
+        # Not rendered yet, or rendered by another thread or process
+        self._refresh_render_state()
+        return self.render_artifacts()
+
+    def _refresh_render_state(self):
+        fields = ('render_status', 'render_version', 'render_error', 'rendered_hash', 'rendered_at',
+                'rendered_html_key', 'rendered_plaintext_key')
+        for field, value in zip(fields, NewsletterIssue.objects.filter(pk=self.pk).values_list(*fields)[0]):
+            setattr(self, field, value)
+
+    def _load_artifact(self, field, render_missing=True):
+        """
+        Return the content of the RenderedArtifact whose key is stored in
+        field, loading it on first use. An artifact that has gone missing
+        is rendered again, or, if render_missing is False, None is returned.
+        """
+        key = getattr(self, field)
+        if not key:
+            return None
+
+        artifacts = self.__dict__.setdefault('_artifacts', {})
+        if key not in artifacts:
+            content = RenderedArtifact.objects.load(key)
+            if content is None:
+                if not render_missing:
+                    return None
+                # Deleted from under us, so the stored render can't be used
+                self.rendered_hash = ''
+                self.get_artifacts()
+                return self._artifacts[getattr(self, field)]
+            artifacts[key] = content
+        return artifacts[key]
+
+    @property
+    def rendered_template(self):
+        """
+        The premailed html of this issue, loaded from its RenderedArtifact.
+        """
+        return self._load_artifact('rendered_html_key')
+
+    @property
+    def rendered_plaintext(self):
+        """
+        The plaintext of this issue, loaded from its RenderedArtifact.
+        """
+        return self._load_artifact('rendered_plaintext_key')
+
+    def get_stored_artifacts(self):
+        """
+        Return the stored (html, plaintext) pair of this issue as it is,
+        with None for artifacts that haven't been rendered or have gone
+        missing. Unlike get_artifacts(), this never renders the issue.
+        """
+        return (self._load_artifact('rendered_html_key', render_missing=False),
+                self._load_artifact('rendered_plaintext_key', render_missing=False))
+
+    def get_tracked_links(self, urls, create=True):
+        """
+        Return a dictionary mapping each of urls to the primary key of
+        its TrackedLink for this issue. Links that don't exist are created
+        together, or, if create is False, left out. Links are remembered,
+        so repeated calls only query for urls that haven't been seen yet.
+        """
+        links = self.__dict__.setdefault('_tracked_links', {})
+
+        if not create:
+            # Load every link of the issue once, so unknown urls cost nothing
+            if not self.__dict__.get('_tracked_links_loaded'):
+                links.update(TrackedLink.objects.filter(issue=self).order_by('-pk').values_list('url', 'pk'))
+                self._tracked_links_loaded = True
+            return dict([(url, links[url]) for url in urls if url in links])
+
+        missing = set(urls) - set(links)
+        if missing:
+            links.update(TrackedLink.objects.filter(issue=self, url__in=missing).order_by('-pk')
+                    .values_list('url', 'pk'))
+            new = [url for url in missing if url not in links]
+            if new:
+                TrackedLink.objects.create_links(self, new)
+                links.update(TrackedLink.objects.filter(issue=self, url__in=new).order_by('-pk')
+                        .values_list('url', 'pk'))
+
+        return dict([(url, links[url]) for url in urls])
 
     def premailer(self, template, plaintext=False):
         """
@@ -273,20 +575,49 @@ class NewsletterIssue(models.Model):
         :param plaintext: Whether to render this template as HTML or plaintext.
         """
         # Prep args to pass to premailer
-        args = ['premailer', '--mode', 'txt' if plaintext else 'html']
+        mode = 'txt' if plaintext else 'html'
+        args = ['premailer', '--mode', mode]
 
-        # Pipe arguments to premailer
-        p = Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
         # Use smart_str to pass a UTF-8 bytestring to premailer
-        premailed, err = p.communicate(input=smart_str(template))
-
-        # Ensure premailer returned a valid response
-        if p.returncode != 0:
-            raise PremailerException(err)
-        else:
-            return premailed
-
-    def premail(self, template=None, canonicalize=True, track=True, plaintext=True):
+        template = smart_str(template)
+
+        # Identical input always produces identical output, so check the cache first
+        cache = get_premailer_cache()
+        if cache is not None:
+            key = content_key(get_premailer_version(), ' '.join(args), template)
+            premailed = cache.get(key)
+            if premailed is not None:
+                return premailed
+
+        # Fail fast while premailer keeps failing, and kill it when it runs over budget
+        breaker = get_breaker('premail')
+        breaker.check()
+        budget = get_budget('premail')
+
+        try:
+            pool = get_premailer_pool()
+            if pool is not None:
+                # Hand the template to a warm worker
+                premailed = pool.premail(template, mode=mode, timeout=budget)
+            else:
+                # Pipe arguments to premailer
+                p = Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+                premailed, err = communicate(p, template, timeout=budget)
+
+                # Ensure premailer returned a valid response
+                if p.returncode != 0:
+                    raise PremailerException(err)
+        except (StageTimeout, PremailerException):
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+
+        if cache is not None:
+            cache.set(key, premailed)
+
+        return premailed
+
+    def premail(self, template=None, canonicalize=True, track=True, plaintext=True, transforms=None):
         """
         Run the newsletter template through several methods to 
         prep it for mailing.
@@ -295,6 +626,8 @@ class NewsletterIssue(models.Model):
         :param canonicalize: If True, canonicalize the links in this template.
         :param track: If True, subject this template to link tracking.
         :param plaintext: Whether to return a plaintext copy of this template.
+        :param transforms: The transforms to apply, as returned by get_premail_transforms(), to
+        reuse them for several templates. Overrides canonicalize and track.
         :return: Returns a tuple (html_template, plaintext_template) containing the two
         rendered templates. If plaintext is False, plaintext_template will be None.
         """
@@ -304,64 +637,212 @@ class NewsletterIssue(models.Model):
         if not template:
             template = self.template
 
-        # Canonicalize relative links
-        if canonicalize:
-            template = canonicalize_links(template)
+        # Parse once, transform the tree, then serialize once
+        if transforms is None:
+            transforms = self.get_premail_transforms(canonicalize=canonicalize, track=track)
 
-        # Track links
-        if track:
-            template = track_document(template, domain=self.tracking_domain,
-                    campaign=self.tracking_campaign, source='newsletter-%s-issue-%s' % (self.newsletter.pk, self.pk,))
+        soup = parse_html(template)
+        for transform, kwargs in transforms:
+            if transform in TRANSFORM_STAGES:
+                soup = run_stage(TRANSFORM_STAGES[transform], transform, soup, **kwargs)
+            else:
+                soup = transform(soup, **kwargs)
+
+        # Convert the parsed document to plaintext in process
+        if plaintext:
+            plaintext_template = smart_str(html_to_text(soup))
 
         # Run premailer
         if getattr(settings, 'NOVA_USE_PREMAILER', False):
-            html_template = self.premailer(template)
-            plaintext_template = self.premailer(template, plaintext=True)
+            if getattr(settings, 'NOVA_PREMAILER_ENGINE', 'premailer') == 'python':
+                # Inline CSS in process on the already parsed document
+                html_template = inline_soup(soup)
+            else:
+                try:
+                    html_template = self.premailer(smart_str(soup))
+                except (StageTimeout, StageUnavailable):
+                    if getattr(settings, 'NOVA_PREMAILER_FALLBACK', None) != 'python':
+                        raise
+                    html_template = inline_soup(soup)
+                    self._premailer_fallback = True
+        else:
+            html_template = soup
+
+        # Minify after inlining, so inlined styles are minified too
+        if getattr(settings, 'NOVA_MINIFY_HTML', False):
+            html_template = minify_html(html_template)
         else:
-            html_template = template
+            html_template = smart_str(html_template)
 
         return (html_template, plaintext_template)
 
-    def render(self, template=None, extra_context=None):
+    def get_premail_transforms(self, canonicalize=True, track=True, personalized=False):
+        """
+        Return the ordered list of (transform, kwargs) pairs that premail applies
+        to the parsed template. Each transform is called with the parsed document
+        and its kwargs, and returns the document. Project specific transforms listed
+        in NOVA_PREMAIL_TRANSFORMS run last and are passed newsletter_issue.
+        Pass personalized for the transforms of a recipient's copy of the issue.
+        """
+        transforms = []
+
+        click_tracking = getattr(settings, 'NOVA_CLICK_TRACKING', False) and self.pk is not None
+        open_tracking = getattr(settings, 'NOVA_OPEN_TRACKING', False) and self.pk is not None
+
+        # Only look up the current site if a transform needs it
+        site_domain = None
+        if canonicalize or click_tracking or open_tracking or (track and not self.tracking_domain):
+            site_domain = Site.objects.get_current().domain
+
+        # Canonicalize relative links
+        if canonicalize:
+            transforms.append((canonicalize_links, {'base_url': 'http://%s' % (site_domain,)}))
+
+        # Track links
+        if track:
+            transforms.append((track_document, {
+                'domain': self.tracking_domain or site_domain,
+                'campaign': self.tracking_campaign,
+                'source': 'newsletter-%s-issue-%s' % (self.newsletter.pk, self.pk,),
+            }))
+
+        # Route links through the click view. Personalized copies only route the links
+        # of the shared render, so per recipient urls don't each get a TrackedLink
+        if click_tracking:
+            transforms.append((track_clicks, {
+                'newsletter_issue': self,
+                'base_url': 'http://%s' % (site_domain,),
+                'create': not personalized,
+            }))
+
+        # Add an open tracking pixel, personalized for each recipient when sent
+        if open_tracking:
+            transforms.append((add_open_pixel, {
+                'url': get_open_pixel_url('http://%s' % (site_domain,), self.pk),
+            }))
+
+        for transform in get_callables(getattr(settings, 'NOVA_PREMAIL_TRANSFORMS', ())):
+            transforms.append((transform, {'newsletter_issue': self}))
+
+        return transforms
+
+    def render(self, template=None, extra_context=None, record_queries=False, processor_context=None):
         """
         Render a django template into a formatted newsletter issue.
         Uses the setting NOVA_CONTEXT_PROCESSORS to load a list of functions, similar to django's
         template context processors to add extra values to the context dictionary.
+        Rendering is subject to the 'render' stage's time budget (see nova.budgets).
+        If record_queries is True, the render's queries are counted and checked against
+        the query budget (see nova.queries). processor_context, as returned by
+        get_processor_context(), is used instead of running the processors again.
         """
-        if not template:
-            template = self.template
+        return run_stage('render', self._render, template or self.template, extra_context, record_queries,
+                processor_context)
 
-        context = Context({
-            'issue': self,
-        })
+    def get_processor_context(self):
+        """
+        Return the context NOVA_CONTEXT_PROCESSORS add for this issue, merged
+        into one dictionary. It doesn't depend on the recipient.
+        """
+        context = {}
+        # Load extra context processors, which are only imported once
+        processors = get_callables(getattr(settings, 'NOVA_CONTEXT_PROCESSORS', []))
+        for processor_context in run_context_processors(processors, self):
+            context.update(processor_context)
+        return context
+
+    def _render(self, template, extra_context, record_queries, processor_context):
+        if record_queries:
+            # Count the queries run by context processors and the template (see nova.queries)
+            recorder = QueryRecorder().start()
+        try:
+            context = Context({
+                'issue': self,
+            })
+
+            if extra_context:
+                context.update(extra_context)
+
+            if processor_context is None:
+                processor_context = self.get_processor_context()
+            context.update(processor_context)
+
+            template = compile_template(template)
+            rendered_template = template.render(context)
+        finally:
+            if record_queries:
+                self._query_stats = recorder.stop()
+
+        if record_queries:
+            check_budget(self._query_stats, 'issue %s' % (self.pk,))
+        return rendered_template
 
-        if extra_context:
-            context.update(extra_context)
+    def get_recipient_contexts(self, email_addresses):
+        """
+        Return a list with the extra render context for each of email_addresses,
+        built with one call to each of NOVA_RECIPIENT_CONTEXT_PROCESSORS.
+        """
+        contexts = [{'email': email_address} for email_address in email_addresses]
 
-        # Load extra context processors
-        for context_processor in getattr(settings, 'NOVA_CONTEXT_PROCESSORS', []):
-            module, attr = context_processor.rsplit('.', 1)
-            module = __import__(module, fromlist=[attr])
-            processor = getattr(module, attr)
-            context.update(processor(newsletter_issue=self))
+        for processor in get_callables(getattr(settings, 'NOVA_RECIPIENT_CONTEXT_PROCESSORS', ())):
+            extra_contexts = processor(newsletter_issue=self, email_addresses=email_addresses)
+            for email_address, context in zip(email_addresses, contexts):
+                context.update(extra_contexts.get(email_address.pk, {}))
 
-        template = Template(template)
-        rendered_template = template.render(context)
+        return contexts
 
-        return rendered_template
+    def get_personalized_artifacts(self, email_address):
+        """
+        Return the (html, plaintext) pair email_address is mailed when this
+        issue is personalized (see NOVA_RECIPIENT_CONTEXT_PROCESSORS).
+        """
+        context = self.get_recipient_contexts([email_address])[0]
+        return self.premail(template=self.render(extra_context=context),
+                transforms=self.get_premail_transforms(track=self.track, personalized=True))
 
     def send(self, subject=None, email_addresses=None, extra_headers=None, mark_as_sent=True):
         """
-        Sends this issue to subscribers of this newsletter. 
+        Sends this issue to subscribers of this newsletter and of any additional
+        newsletters it targets. Each address receives the issue only once.
 
         :param subject: An optional subject to be used for the newsletter. Defaults to self.subject.
         :param email_addresses: A list of EmailAddress objects to be used as the recipient list.
+            Defaults to self.recipients.
         :param extra_headers: Any extra mail headers to be used.
         :param mark_as_sent: Whether to record this issue as sent.
 
-        :todo: This method is not very performant as it has to render a template
-        for every recipient of a newsletter. Investigate any options to make this
-        method more performant.
+        The issue is rendered and premailed once, and the result is reused
+        by later sends until the template or its settings change.
+        """
+        # Reuse a single connection for every recipient
+        connection = get_connection(getattr(settings, 'NOVA_EMAIL_BACKEND', None))
+        connection.open()
+
+        try:
+            for send_to in self.iter_send(subject=subject, email_addresses=email_addresses,
+                    extra_headers=extra_headers, mark_as_sent=mark_as_sent, connection=connection):
+                pass
+        finally:
+            connection.close()
+
+    def iter_send(self, subject=None, email_addresses=None, extra_headers=None, mark_as_sent=True,
+            connection=None, resume=False):
+        """
+        A generator that sends this issue one recipient at a time, yielding each
+        EmailAddress after its message has been sent. The issue is prepared when
+        the first message is requested. Used by send() and by nova.scheduler to
+        interleave several issues. Takes the same arguments as send(), plus:
+
+        :param connection: An open email backend to send messages through.
+        :param resume: Continue a send that was paused by a volume quota.
+
+        When sending to self.recipients while a warm-up schedule is configured (see
+        nova.warmup), every message counts against the volume quotas. Quota is
+        reserved a chunk of recipients at a time, and what a chunk doesn't use,
+        e.g. because a message failed, is given back. Once a quota is used up the
+        send stops, and send_paused and send_cursor record where it left off. A send
+        to self.recipients that a failing stage (see nova.budgets) stops partway is
+        paused the same way before the error is raised.
         """
         if not subject:
             subject = self.subject
@@ -374,27 +855,135 @@ class NewsletterIssue(models.Model):
         if extra_headers:
             headers.update(extra_headers)
 
-        # Default to sending to all active subscribers
+        # Default to sending to all active subscribers of every targeted newsletter
+        # and enforce volume quotas, if any, while doing so
+        enforce_quotas = record_progress = False
         if not email_addresses:
-            email_addresses = self.newsletter.subscribers
+            email_addresses = self.recipients
+            enforce_quotas = get_quota_limits() is not None
+            record_progress = True
+
+            if resume and self.send_cursor:
+                email_addresses = email_addresses.filter(pk__gt=self.send_cursor)
+            else:
+                self.send_cursor = None
 
         # Update sent_at timestamp
         if mark_as_sent:
-            self.sent_at = datetime.now()
-            self.save()
-
-        # Render and Premail template
-        rendered_html_template, rendered_plaintext_template = self.premail(track=self.track,
-                template=self.render())
-
-        for send_to in email_addresses:
-            # Send multipart message
-            send_multipart_mail(subject,
-                    txt_body=rendered_plaintext_template,
-                    html_body=rendered_html_template,
-                    from_email=self.newsletter.from_email,
-                    headers=headers,
-                    recipient_list=(send_to.email,))
+            self._update_send_state(sent_at=datetime.now())
+
+        # Reuse the rendered and premailed template unless its inputs have changed
+        if getattr(settings, 'NOVA_BACKGROUND_RENDERING', False):
+            rendered_html_template, rendered_plaintext_template = self.wait_for_render()
+        else:
+            rendered_html_template, rendered_plaintext_template = self.get_artifacts()
+
+        # Publish the issue to the web archive before anyone can follow a link to it
+        if mark_as_sent and archive.get_archive_dir():
+            self.publish()
+
+        # One signer per send, so the body is only hashed once
+        signer = get_signer()
+
+        # Identify the recipient in the open tracking pixel, if there is one
+        base_url = 'http://%s' % (Site.objects.get_current().domain,)
+        open_tracking = get_open_pixel_url(base_url, self.pk) in rendered_html_template
+
+        # Personalized issues are rendered for each recipient, with the context
+        # for a whole chunk of recipients fetched at once
+        personalize = bool(getattr(settings, 'NOVA_RECIPIENT_CONTEXT_PROCESSORS', ()))
+        chunk_size = getattr(settings, 'NOVA_RECIPIENT_CHUNK_SIZE', 500)
+
+        if personalize:
+            # Only the recipient context differs between copies, the rest is prepared once
+            processor_context = self.get_processor_context()
+            transforms = self.get_premail_transforms(track=self.track, personalized=True)
+            premailed_copies = LRUCache(PERSONALIZED_CACHE_SIZE)
+
+        for chunk in chunks(email_addresses, chunk_size):
+            # Pause once a volume quota has been used up
+            reserved, volume_ids = len(chunk), []
+            if enforce_quotas:
+                reserved, volume_ids = SendVolume.objects.reserve(len(chunk))
+                if not reserved:
+                    self._update_send_state(send_paused=True, send_cursor=self.send_cursor)
+                    return
+
+            if personalize:
+                contexts = self.get_recipient_contexts(chunk[:reserved])
+
+            sent = 0
+            stopped = False
+            try:
+                for index, send_to in enumerate(chunk[:reserved]):
+                    if personalize:
+                        rendered = self.render(extra_context=contexts[index], processor_context=processor_context)
+                        key = content_key(rendered)
+                        premailed = premailed_copies.get(key)
+                        if premailed is None:
+                            premailed = self.premail(template=rendered, transforms=transforms)
+                            premailed_copies.set(key, premailed)
+                        html_body, txt_body = premailed
+                    else:
+                        html_body, txt_body = rendered_html_template, rendered_plaintext_template
+
+                    if open_tracking:
+                        html_body = personalize_open_pixel(html_body, base_url, self.pk, send_to.pk)
+
+                    # Send multipart message
+                    send_multipart_mail(subject,
+                            txt_body=txt_body,
+                            html_body=html_body,
+                            from_email=self.newsletter.from_email,
+                            headers=headers,
+                            recipient_list=(send_to.email,),
+                            signer=signer,
+                            connection=connection)
+
+                    sent += 1
+                    yield send_to
+            except (StageTimeout, StageUnavailable):
+                stopped = True
+                raise
+            finally:
+                # Give back quota that wasn't used, and record progress once per chunk. A send
+                # stopped by a failing stage is paused, so it's resumed instead of starting over
+                if enforce_quotas:
+                    SendVolume.objects.release(volume_ids, reserved - sent)
+                if record_progress and (sent or stopped):
+                    self._update_send_state(send_paused=stopped,
+                            send_cursor=chunk[sent - 1].pk if sent else self.send_cursor)
+
+            if reserved < len(chunk):
+                self._update_send_state(send_paused=True, send_cursor=self.send_cursor)
+                return
+
+        if record_progress and (self.send_paused or self.send_cursor is not None):
+            self._update_send_state(send_paused=False, send_cursor=None)
+
+    def publish(self):
+        """
+        Write this issue's premailed html to the static web archive
+        (see nova.archive) and return the path it was written to.
+        """
+        html, plaintext = self.get_artifacts()
+        html = remove_open_pixel(html, 'http://%s' % (Site.objects.get_current().domain,), self.pk)
+        return archive.publish(self.pk, html)
+
+    def get_archive_url(self):
+        """
+        Return the url of this issue in the web archive, or None.
+        """
+        return archive.get_archive_url(self.pk)
+
+    def _update_send_state(self, **kwargs):
+        """
+        Update fields that record the progress of a send or the rendered
+        artifacts without saving (and re-rendering) the issue.
+        """
+        for field, value in kwargs.items():
+            setattr(self, field, value)
+        NewsletterIssue.objects.filter(pk=self.pk).update(**kwargs)
 
     def send_test(self):
         """
@@ -423,6 +1012,374 @@ class NewsletterIssue(models.Model):
         return reverse('nova.views.preview', args=[self.id])
 
 
+class RenderedArtifactManager(models.Manager):
+    def store(self, content):
+        """
+        Store content, compressed, and return its key. Identical
+        content is only stored once.
+        """
+        content = smart_str(content)
+        key = content_key(content)
+
+        if not self.filter(key=key).exists():
+            try:
+                self.get_or_create(key=key, defaults={
+                    'data': base64.b64encode(zlib.compress(content, 6)),
+                    'size': len(content),
+                })
+            except IntegrityError:
+                # Another process stored the same content first
+                transaction.rollback_unless_managed()
+
+        return key
+
+    def load(self, key):
+        """
+        Return the content stored under key as a unicode string, or
+        None if there is no such artifact (e.g. it has been deleted).
+        """
+        data = self.filter(key=key).values_list('data', flat=True)[:1]
+        if not data:
+            return None
+        return zlib.decompress(base64.b64decode(data[0])).decode('utf-8')
+
+    def delete_unused(self):
+        """
+        Delete artifacts that no issue refers to any more, e.g. renders of
+        templates that have since been edited. Returns the number deleted.
+        """
+        used = set(NewsletterIssue.objects.values_list('rendered_html_key', flat=True))
+        used.update(NewsletterIssue.objects.values_list('rendered_plaintext_key', flat=True))
+
+        unused = [key for key in self.values_list('key', flat=True) if key not in used]
+        for start in range(0, len(unused), 500):
+            self.filter(key__in=unused[start:start + 500]).delete()
+        return len(unused)
+
+class RenderedArtifact(models.Model):
+    """
+    The zlib compressed (and base64 encoded) content of a rendered newsletter
+    issue, keyed by a hash of the content, so issues that render identically
+    share one row and issue rows stay small.
+    """
+    key = models.CharField(max_length=40, primary_key=True)
+    data = models.TextField()
+    size = models.PositiveIntegerField(help_text=_("The uncompressed size in bytes."))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RenderedArtifactManager()
+
+    def __unicode__(self):
+        """
+        String-ify this rendered artifact
+        """
+        return u'%s (%s bytes)' % (self.key, self.size)
+
+
+class SendVolumeManager(models.Manager):
+    def reserve(self, count, now=None):
+        """
+        Reserve up to count messages against the daily and hourly volume
+        quotas. Returns the number of messages reserved, which is less than
+        count once a quota runs low, and the primary keys of the SendVolumes
+        they were counted against, for release().
+        """
+        limits = get_quota_limits(now)
+        if limits is None:
+            return count, []
+
+        windows = get_windows(now)
+        reserved = []
+
+        for period, limit in zip((DAY, HOUR), limits):
+            if limit is None:
+                continue
+
+            try:
+                volume, created = self.get_or_create(period=period, window_start=windows[period])
+            except IntegrityError:
+                # Another process created this window first
+                volume = self.get(period=period, window_start=windows[period])
+
+            granted = self._reserve_window(volume.pk, limit, count)
+            reserved.append((volume.pk, granted))
+            count = min(count, granted)
+            if not count:
+                break
+
+        # Give back what was counted against a window beyond what a tighter window allowed
+        for pk, granted in reserved:
+            if granted > count:
+                self.filter(pk=pk).update(sent=F('sent') - (granted - count))
+
+        return count, [pk for pk, granted in reserved]
+
+    def _reserve_window(self, pk, limit, count, attempts=5):
+        # Increment atomically, so concurrent sends can't overrun the quota
+        if self.filter(pk=pk, sent__lte=limit - count).update(sent=F('sent') + count):
+            return count
+
+        # Not enough left for all of them, so take what is left
+        for attempt in range(attempts):
+            sent = self.filter(pk=pk).values_list('sent', flat=True)[0]
+            granted = min(count, max(limit - sent, 0))
+            if not granted or self.filter(pk=pk, sent=sent).update(sent=sent + granted):
+                return granted
+        return 0
+
+    def release(self, volume_ids, count):
+        """
+        Give back count messages reserved against the SendVolumes with
+        the given primary keys, e.g. for messages that failed to send.
+        """
+        if count and volume_ids:
+            self.filter(pk__in=volume_ids).update(sent=F('sent') - count)
+
+
+class SendVolume(models.Model):
+    """
+    The number of messages sent during a daily or hourly window,
+    used to enforce warm-up volume quotas.
+    """
+    period = models.CharField(max_length=4, choices=((DAY, _('Day')), (HOUR, _('Hour')),))
+    window_start = models.DateTimeField()
+    sent = models.PositiveIntegerField(default=0)
+
+    objects = SendVolumeManager()
+
+    def __unicode__(self):
+        """
+        String-ify this send volume
+        """
+        return u'%s sent in the %s starting %s' % (self.sent, self.period, self.window_start)
+
+    class Meta:
+        unique_together = ('period', 'window_start',)
+
+
+class TrackedLinkManager(models.Manager):
+    def create_links(self, issue, urls):
+        """
+        Create TrackedLinks of issue for urls with one INSERT per
+        TRACKED_LINK_INSERT_BATCH_SIZE urls.
+        """
+        qn = connection.ops.quote_name
+        columns = ('issue_id', 'url', 'clicks', 'created_at')
+        created_at = connection.ops.value_to_db_datetime(datetime.now())
+
+        for start in range(0, len(urls), TRACKED_LINK_INSERT_BATCH_SIZE):
+            batch = urls[start:start + TRACKED_LINK_INSERT_BATCH_SIZE]
+            params = []
+            for url in batch:
+                params.extend((issue.pk, url, 0, created_at))
+
+            sql = 'INSERT INTO %s (%s) VALUES %s' % (qn(self.model._meta.db_table),
+                    ', '.join([qn(column) for column in columns]),
+                    ', '.join(['(%s)' % (', '.join(['%s'] * len(columns)),)] * len(batch)))
+            connection.cursor().execute(sql, params)
+        transaction.commit_unless_managed()
+
+    def get_url(self, pk):
+        """
+        Return the url of the TrackedLink with primary key pk, or None.
+        Urls are cached in process since they never change.
+        """
+        global _tracked_link_urls
+        if _tracked_link_urls is None:
+            _tracked_link_urls = LRUCache(getattr(settings, 'NOVA_TRACKED_LINK_CACHE_SIZE', 1024))
+
+        url = _tracked_link_urls.get(pk)
+        if url is None:
+            try:
+                url = self.filter(pk=pk).values_list('url', flat=True)[0]
+            except IndexError:
+                return None
+            _tracked_link_urls.set(pk, url)
+        return url
+
+    def add_clicks(self, counts):
+        """
+        Add clicks to links, given a dictionary of primary key to count.
+        Links with the same count are updated together.
+        """
+        by_count = {}
+        for pk, count in counts.items():
+            by_count.setdefault(count, []).append(pk)
+
+        for count, pks in by_count.items():
+            self.filter(pk__in=pks).update(clicks=F('clicks') + count)
+
+_tracked_link_urls = None
+
+# The number of TrackedLinks inserted per statement
+TRACKED_LINK_INSERT_BATCH_SIZE = 100
+
+class TrackedLink(models.Model):
+    """
+    A link in a newsletter issue whose clicks are counted by nova (see nova.tracking).
+    """
+    issue = models.ForeignKey(NewsletterIssue, related_name='tracked_links')
+    url = models.TextField()
+    clicks = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TrackedLinkManager()
+
+    def __unicode__(self):
+        """
+        String-ify this tracked link
+        """
+        return u'%s' % self.url
+
+class IssueOpenManager(models.Manager):
+    def record_opens(self, counts, now=None):
+        """
+        Record opens, given a dictionary of (issue pk, email address pk) to
+        count. Opens by recipients with an IssueOpen are added with one UPDATE
+        per distinct count, and the rest are created with a bulk INSERT. Opens
+        of issues or addresses that don't exist are ignored.
+        """
+        now = now or datetime.now()
+        issue_ids = set([issue_id for issue_id, email_id in counts])
+        email_ids = set([email_id for issue_id, email_id in counts])
+
+        existing = {}
+        for pk, issue_id, email_id in self.filter(issue__in=issue_ids,
+                email_address__in=email_ids).values_list('pk', 'issue', 'email_address'):
+            existing[(issue_id, email_id)] = pk
+
+        by_count = {}
+        for key, count in counts.items():
+            if key in existing:
+                by_count.setdefault(count, []).append(existing[key])
+
+        for count, pks in by_count.items():
+            self.filter(pk__in=pks).update(opens=F('opens') + count, last_opened_at=now)
+
+        new = [key for key in counts if key not in existing]
+        if new:
+            issue_ids = set(NewsletterIssue.objects.filter(pk__in=issue_ids).values_list('pk', flat=True))
+            email_ids = set(EmailAddress.objects.filter(pk__in=email_ids).values_list('pk', flat=True))
+            new = [(issue_id, email_id) for issue_id, email_id in new
+                    if issue_id in issue_ids and email_id in email_ids]
+
+        for start in range(0, len(new), OPEN_INSERT_BATCH_SIZE):
+            self._insert_opens([(key, counts[key]) for key in new[start:start + OPEN_INSERT_BATCH_SIZE]], now)
+
+    def _insert_opens(self, rows, now):
+        """
+        Insert IssueOpens for ((issue pk, email address pk), count) rows in a
+        single statement, falling back to one row at a time if another
+        process recorded some of them first.
+        """
+        qn = connection.ops.quote_name
+        columns = ('issue_id', 'email_address_id', 'opens', 'first_opened_at', 'last_opened_at')
+        opened_at = connection.ops.value_to_db_datetime(now)
+
+        params = []
+        for (issue_id, email_id), count in rows:
+            params.extend((issue_id, email_id, count, opened_at, opened_at))
+
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (qn(self.model._meta.db_table),
+                ', '.join([qn(column) for column in columns]),
+                ', '.join(['(%s)' % (', '.join(['%s'] * len(columns)),)] * len(rows)))
+
+        try:
+            connection.cursor().execute(sql, params)
+            transaction.commit_unless_managed()
+        except IntegrityError:
+            transaction.rollback_unless_managed()
+            for (issue_id, email_id), count in rows:
+                issue_open, created = self.get_or_create(issue_id=issue_id, email_address_id=email_id,
+                        defaults={'opens': count, 'first_opened_at': now, 'last_opened_at': now})
+                if not created:
+                    self.filter(pk=issue_open.pk).update(opens=F('opens') + count, last_opened_at=now)
+
+# The number of IssueOpens inserted per statement
+OPEN_INSERT_BATCH_SIZE = 100
+
+class IssueOpen(models.Model):
+    """
+    The number of times a recipient opened a newsletter issue, as
+    counted by the open tracking pixel (see nova.tracking).
+    """
+    issue = models.ForeignKey(NewsletterIssue, related_name='opens')
+    email_address = models.ForeignKey(EmailAddress, related_name='issue_opens')
+    opens = models.PositiveIntegerField(default=0)
+    first_opened_at = models.DateTimeField()
+    last_opened_at = models.DateTimeField()
+
+    objects = IssueOpenManager()
+
+    def __unicode__(self):
+        """
+        String-ify this issue open
+        """
+        return u'%s opened %s' % (self.email_address, self.issue)
+
+    class Meta:
+        unique_together = ('issue', 'email_address',)
+
+_click_counter = None
+
+def get_click_counter():
+    """
+    Return the process wide buffer of clicks on TrackedLinks. Buffered
+    clicks are also written when the process exits.
+    """
+    global _click_counter
+    if _click_counter is None:
+        _click_counter = BufferedCounter(TrackedLink.objects.add_clicks,
+                max_pending=getattr(settings, 'NOVA_CLICK_FLUSH_SIZE', 100),
+                interval=getattr(settings, 'NOVA_CLICK_FLUSH_INTERVAL', 10),
+                background=True)
+        atexit.register(_click_counter.flush)
+    return _click_counter
+
+_open_counter = None
+
+def get_open_counter():
+    """
+    Return the process wide buffer of issue opens, keyed by (issue pk,
+    email address pk). Buffered opens are also written when the process exits.
+    """
+    global _open_counter
+    if _open_counter is None:
+        _open_counter = BufferedCounter(IssueOpen.objects.record_opens,
+                max_pending=getattr(settings, 'NOVA_OPEN_FLUSH_SIZE', 500),
+                interval=getattr(settings, 'NOVA_OPEN_FLUSH_INTERVAL', 10),
+                background=True)
+        atexit.register(_open_counter.flush)
+    return _open_counter
+
+def render_issue(issue_id, version):
+    """
+    Render version of the NewsletterIssue with primary key issue_id for a
+    RenderQueue. Returns False if that version hasn't been committed yet.
+    """
+    try:
+        issue = NewsletterIssue.objects.get(pk=issue_id)
+    except NewsletterIssue.DoesNotExist:
+        return False
+
+    if issue.render_version < version:
+        return False
+    if issue.render_version == version:
+        issue.render_artifacts()
+    return True
+
+_render_queue = None
+
+def get_render_queue():
+    """
+    Return the process wide queue of issues to render in the background.
+    """
+    global _render_queue
+    if _render_queue is None:
+        _render_queue = RenderQueue(render_issue)
+    return _render_queue
+
+
 class Subscription(models.Model):
     """
     This model subscribes an EmailAddress instance to a Newsletter instance.
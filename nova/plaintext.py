@@ -0,0 +1,170 @@
+"""
+An in-process HTML to plaintext converter, used for the plaintext part of
+newsletter issues instead of running premailer a second time.
+
+The converter walks an already parsed document (BeautifulSoup 3 or 4, see
+nova.helpers.parse_html) and follows the layout of premailer's plaintext
+mode: headings are underlined, paragraphs are separated by blank lines and
+wrapped, list items are bulleted and links are followed by their url.
+"""
+import re
+import textwrap
+from HTMLParser import HTMLParser
+
+from nova.helpers import parse_html
+
+# The width plaintext paragraphs are wrapped to
+LINE_LENGTH = 65
+
+SKIPPED_TAGS = frozenset(('head', 'title', 'style', 'script'))
+BLOCK_TAGS = frozenset(('address', 'blockquote', 'center', 'dd', 'div', 'dl', 'dt', 'form',
+    'hr', 'li', 'ol', 'p', 'pre', 'table', 'tbody', 'tfoot', 'thead', 'tr', 'ul'))
+CELL_TAGS = frozenset(('td', 'th'))
+HEADING_TAGS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+SKIPPED_STRINGS = frozenset(('Comment', 'Declaration', 'Doctype', 'ProcessingInstruction'))
+
+# Placeholders for explicit line breaks while whitespace is collapsed, and
+# for spaces that paragraphs shouldn't be wrapped at
+LINE_BREAK = u'\x00'
+NO_BREAK_SPACE = u'\x01'
+WHITESPACE_RE = re.compile(r'[ \t\r\n\f\v]+')
+
+_unescape = HTMLParser().unescape
+
+class _Writer(object):
+    """
+    Collects inline text into blocks.
+    """
+    def __init__(self, unescape):
+        self.unescape = unescape
+        self.blocks = []
+        self.inline = []
+        self.prefix = u''
+        self.item_of = None
+
+    def write(self, text):
+        self.inline.append(text)
+
+    def flush(self):
+        text = WHITESPACE_RE.sub(u' ', u''.join(self.inline))
+        lines = [line.strip() for line in text.split(LINE_BREAK)]
+        text = u'\n'.join([line for line in lines if line])
+        if text:
+            self.blocks.append((self.prefix + text, True, self.item_of))
+            self.prefix = u''
+            self.item_of = None
+        self.inline = []
+
+    def write_block(self, text):
+        """
+        Add a block that is already laid out and shouldn't be wrapped.
+        """
+        self.flush()
+        self.blocks.append((text, False, None))
+
+def _text(node, writer):
+    text = unicode(node)
+    if writer.unescape:
+        text = _unescape(text)
+    return text
+
+def _heading(level, text):
+    text = u' '.join(text.split())
+    rule_length = min(len(text), LINE_LENGTH)
+    if level == 1:
+        return u'%s\n%s\n%s' % (u'*' * rule_length, text, u'*' * rule_length)
+    elif level == 2:
+        return u'%s\n%s\n%s' % (u'-' * rule_length, text, u'-' * rule_length)
+    return u'%s\n%s' % (text, u'-' * rule_length)
+
+def _walk(node, writer, list_stack):
+    for child in node.contents:
+        name = getattr(child, 'name', None)
+        if name is None:
+            if child.__class__.__name__ not in SKIPPED_STRINGS:
+                writer.write(_text(child, writer))
+            continue
+
+        name = name.lower()
+        if name in SKIPPED_TAGS:
+            continue
+
+        if name == 'br':
+            writer.write(LINE_BREAK)
+        elif name == 'img':
+            if child.get('alt'):
+                writer.write(u' %s ' % (child['alt'],))
+        elif name == 'a':
+            start = len(writer.inline)
+            _walk(child, writer, list_stack)
+            text = u''.join(writer.inline[start:]).strip()
+            href = (child.get('href') or u'').strip()
+            if href.startswith('mailto:'):
+                href = href[len('mailto:'):]
+            if href and not href.startswith('#') and href != text:
+                # Keep the reference on the same line as the end of the link text
+                writer.write(u'%(space)s(%(space)s%(href)s%(space)s)' % {'space': NO_BREAK_SPACE, 'href': href})
+        elif name in HEADING_TAGS:
+            heading = _Writer(writer.unescape)
+            _walk(child, heading, list_stack)
+            heading.flush()
+            if heading.blocks:
+                writer.write_block(_heading(int(name[1]), u' '.join([block[0] for block in heading.blocks])))
+        elif name == 'hr':
+            writer.write_block(u'-' * LINE_LENGTH)
+        elif name in ('ul', 'ol'):
+            writer.flush()
+            list_stack.append([name, 0])
+            _walk(child, writer, list_stack)
+            list_stack.pop()
+            writer.flush()
+        elif name == 'li':
+            writer.flush()
+            if list_stack and list_stack[-1][0] == 'ol':
+                list_stack[-1][1] += 1
+                writer.prefix = u'%d. ' % (list_stack[-1][1],)
+            else:
+                writer.prefix = u'* '
+            writer.item_of = list_stack and list_stack[-1] or None
+            _walk(child, writer, list_stack)
+            writer.flush()
+        elif name in BLOCK_TAGS:
+            writer.flush()
+            _walk(child, writer, list_stack)
+            writer.flush()
+        elif name in CELL_TAGS:
+            writer.write(u' ')
+            _walk(child, writer, list_stack)
+            writer.write(u' ')
+        else:
+            _walk(child, writer, list_stack)
+
+def _wrap(block):
+    return u'\n'.join([textwrap.fill(line, LINE_LENGTH, break_long_words=False,
+            break_on_hyphens=False) for line in block.split(u'\n')])
+
+def html_to_text(html):
+    """
+    Convert an HTML document into readable plaintext.
+
+    :param html: The document to convert, either a string or a document
+        already parsed with nova.helpers.parse_html, which is not modified.
+    :return: The plaintext as a unicode string.
+    """
+    soup = parse_html(html)
+
+    # BeautifulSoup 3 leaves entities in text as they are
+    writer = _Writer(unescape=not type(soup).__module__.startswith('bs4'))
+    _walk(soup, writer, [])
+    writer.flush()
+
+    # Blocks are separated by a blank line, except for items of the same list
+    text = []
+    previous_list = None
+    for block, wrap, item_of in writer.blocks:
+        if text:
+            text.append(u'\n' if item_of is not None and item_of is previous_list else u'\n\n')
+        text.append(_wrap(block) if wrap else block)
+        previous_list = item_of
+
+    return u''.join(text).replace(NO_BREAK_SPACE, u' ')
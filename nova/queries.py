@@ -0,0 +1,134 @@
+"""
+Database query accounting for rendering newsletter issues.
+
+Templates and context processors that run a query per loop iteration (a
+{% for %} over related objects, say) slow down every render of an issue. Each
+render counts its queries and their time, groups them into patterns (the SQL
+with its literal values replaced by '?') and reports patterns repeated often
+enough to look like N+1 queries. Only renders of an issue's artifacts are
+counted, not the personalized renders made for each recipient while sending.
+The numbers for the most recent one are stored on the issue and shown in the
+admin.
+
+Queries run by independent context processors (see nova.context) happen on
+other threads and aren't counted.
+
+project specific settings:
+NOVA_RENDER_QUERY_BUDGET:
+    The number of queries a render may run. Defaults to None, no budget.
+NOVA_RENDER_QUERY_TIME_BUDGET:
+    The number of seconds a render's queries may take. Defaults to None, no budget.
+NOVA_RENDER_QUERY_BUDGET_ACTION:
+    'warn' to log a warning to the 'nova.queries' logger when a render goes
+    over budget, or 'fail' to raise QueryBudgetExceeded. Defaults to 'warn'.
+NOVA_N_PLUS_ONE_THRESHOLD:
+    The number of times a query pattern may repeat in a render before it is
+    logged as a likely N+1 query. Defaults to 10.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('nova.queries')
+
+# The number of query patterns kept in a report
+REPORT_SIZE = 5
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\?, )+\?\)', re.IGNORECASE)
+
+class QueryBudgetExceeded(Exception):
+    """
+    Exception thrown when a render runs more or slower queries than its budget allows
+    """
+
+def normalize_sql(sql):
+    """
+    Return the pattern of a query: its SQL with literal values replaced
+    by '?' and lists of values collapsed to a single '?'.
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (?)', sql)
+
+class QueryStats(object):
+    """
+    The queries run during a render, grouped by pattern.
+    """
+    def __init__(self, queries):
+        self.count = len(queries)
+        self.time = 0.0
+        patterns = {}
+        for query in queries:
+            duration = float(query['time'])
+            self.time += duration
+            pattern = patterns.setdefault(normalize_sql(query['sql']), [0, 0.0])
+            pattern[0] += 1
+            pattern[1] += duration
+
+        # The most repeated patterns first, then the slowest
+        self.patterns = sorted([(sql, count, duration) for sql, (count, duration) in patterns.items()],
+                key=lambda pattern: (-pattern[1], -pattern[2]))
+
+    def repeated_patterns(self, threshold):
+        """
+        Return the patterns that were run more than threshold times.
+        """
+        return [pattern for pattern in self.patterns if pattern[1] > threshold]
+
+    def report(self):
+        """
+        Return a readable summary of the worst query patterns.
+        """
+        lines = ['%d queries in %.3f seconds' % (self.count, self.time)]
+        for sql, count, duration in self.patterns[:REPORT_SIZE]:
+            lines.append('%dx %.3fs %s' % (count, duration, sql))
+        return '\n'.join(lines)
+
+class QueryRecorder(object):
+    """
+    Records the queries run on this thread's database connections between
+    start() and stop().
+    """
+    def start(self):
+        self.state = []
+        for connection in connections.all():
+            self.state.append((connection, connection.use_debug_cursor, len(connection.queries)))
+            connection.use_debug_cursor = True
+        return self
+
+    def stop(self):
+        """
+        Stop recording and return the QueryStats of the recorded queries.
+        """
+        queries = []
+        for connection, use_debug_cursor, start in self.state:
+            queries.extend(connection.queries[start:])
+            connection.use_debug_cursor = use_debug_cursor
+            if not (use_debug_cursor or (use_debug_cursor is None and settings.DEBUG)):
+                # The queries were only logged for us, so don't let them pile up
+                del connection.queries[start:]
+        return QueryStats(queries)
+
+def check_budget(stats, name):
+    """
+    Compare the QueryStats of rendering name with the configured budgets,
+    warning about or failing renders that exceed them, and log repeated
+    query patterns.
+    """
+    threshold = getattr(settings, 'NOVA_N_PLUS_ONE_THRESHOLD', 10)
+    for sql, count, duration in stats.repeated_patterns(threshold):
+        logger.warning('Rendering %s ran a query %d times, which may be an N+1 query: %s', name, count, sql)
+
+    budget = getattr(settings, 'NOVA_RENDER_QUERY_BUDGET', None)
+    time_budget = getattr(settings, 'NOVA_RENDER_QUERY_TIME_BUDGET', None)
+    if (budget is None or stats.count <= budget) and (time_budget is None or stats.time <= time_budget):
+        return
+
+    message = 'Rendering %s went over its query budget: %s' % (name, stats.report())
+    if getattr(settings, 'NOVA_RENDER_QUERY_BUDGET_ACTION', 'warn') == 'fail':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,96 @@
+"""
+Background rendering of newsletter issues.
+
+By default NewsletterIssue.save renders and premails the issue before it
+returns. With NOVA_BACKGROUND_RENDERING enabled, save() only stores the issue
+and marks its artifacts stale, and a worker thread renders them shortly after.
+Every save bumps the issue's render_version, so the worker can tell a save that
+hasn't been committed yet (it tries again a little later) from one that has
+already been superseded by a newer save (it leaves that to the newer job).
+
+Sending an issue whose render is still running waits for it, and renders the
+issue itself if the artifacts are still stale. Issues whose background render
+was lost, e.g. because the process exited, are rendered by the render_issues
+management command, or the next time they are sent.
+
+project specific settings:
+NOVA_BACKGROUND_RENDERING:
+    If True, render issues on a background thread after they are saved. Defaults to False.
+NOVA_RENDER_WAIT:
+    The number of seconds a send waits for a background render in progress
+    before rendering the issue itself. Defaults to 60.
+"""
+import threading
+import time
+from Queue import Queue
+
+from django.db import close_connection
+
+class RenderQueue(object):
+    """
+    A queue of (issue pk, render version) jobs handled one at a time by a
+    daemon thread. render_function is called with each job and returns
+    False if the job should be tried again after retry_delay seconds, up
+    to retries times. Jobs for an issue that is already queued replace
+    the queued job.
+    """
+    def __init__(self, render_function, retries=20, retry_delay=0.5):
+        self.render_function = render_function
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = Queue()
+        self.versions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, issue_id, version):
+        """
+        Queue a render of version of the issue with primary key issue_id.
+        """
+        with self._lock:
+            queued = issue_id in self.versions
+            self.versions[issue_id] = version
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+
+        if not queued:
+            self.queue.put((issue_id, 0))
+
+    def _work(self):
+        while True:
+            issue_id, attempt = self.queue.get()
+            with self._lock:
+                version = self.versions.get(issue_id)
+
+            try:
+                done = self.render_function(issue_id, version)
+            except Exception:
+                # The issue is marked as failed by render_function
+                done = True
+            finally:
+                # Threads get their own database connection
+                close_connection()
+
+            with self._lock:
+                if self.versions.get(issue_id) != version:
+                    # Saved again while rendering, render the new version
+                    done, attempt = False, -1
+                elif done or attempt >= self.retries:
+                    del self.versions[issue_id]
+                    continue
+
+            if attempt >= 0:
+                time.sleep(self.retry_delay)
+            self.queue.put((issue_id, attempt + 1))
+
+    def join(self):
+        """
+        Wait until every queued job has been handled.
+        """
+        while True:
+            with self._lock:
+                if not self.versions:
+                    return
+            time.sleep(0.05)
@@ -0,0 +1,78 @@
+"""
+Fair delivery scheduling for newsletter issues that are sent at the same time.
+
+Without a scheduler, issues sent together are delivered one after another and the
+first issue holds the connection until every one of its recipients has been sent.
+The scheduler interleaves the issues with a weighted round-robin instead, so every
+active send makes progress and a small list finishes in proportion to its size.
+"""
+from collections import deque
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+class FairScheduler(object):
+    """
+    Weighted round-robin over a set of delivery iterators.
+
+    Each turn, an iterator may deliver up to its quantum of messages before
+    the next iterator gets a turn. Iterators are dropped once exhausted.
+    """
+    def __init__(self):
+        self.queue = deque()
+
+    def add(self, deliveries, quantum=1):
+        """
+        Add an iterator of deliveries to the schedule.
+
+        :param deliveries: An iterator that sends one message per step, such
+            as NewsletterIssue.iter_send().
+        :param quantum: The number of messages delivered per turn.
+        """
+        self.queue.append((iter(deliveries), max(int(quantum), 1)))
+
+    def run(self):
+        """
+        Deliver every scheduled message and return the number sent.
+        """
+        sent = 0
+
+        while self.queue:
+            deliveries, quantum = self.queue.popleft()
+            for i in xrange(quantum):
+                try:
+                    deliveries.next()
+                except StopIteration:
+                    break
+                sent += 1
+            else:
+                self.queue.append((deliveries, quantum))
+
+        return sent
+
+def send_issues(issues, quotas=None, **kwargs):
+    """
+    Send several newsletter issues at once, sharing one connection fairly
+    between them.
+
+    :param issues: An iterable of NewsletterIssue instances.
+    :param quotas: An optional dictionary mapping issue primary keys to the number
+        of messages sent per turn. Defaults to the send_priority of each issue's
+        newsletter.
+    :param kwargs: Any extra arguments are passed to NewsletterIssue.iter_send.
+    :return: The number of messages sent.
+    """
+    quotas = quotas or {}
+    scheduler = FairScheduler()
+
+    connection = get_connection(getattr(settings, 'NOVA_EMAIL_BACKEND', None))
+    connection.open()
+
+    try:
+        for issue in issues:
+            scheduler.add(issue.iter_send(connection=connection, **kwargs),
+                    quantum=quotas.get(issue.pk, issue.newsletter.send_priority))
+
+        return scheduler.run()
+    finally:
+        connection.close()
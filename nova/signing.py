@@ -0,0 +1,177 @@
+"""
+DKIM signing for newsletter mail.
+
+Signing uses the relaxed/relaxed canonicalization with rsa-sha256 and relies on
+the (optional) dkimpy package for key parsing and RSA primitives.
+
+project specific settings:
+NOVA_DKIM_DOMAIN:
+    The signing domain (d= tag). Signing is disabled unless this is set.
+NOVA_DKIM_SELECTOR:
+    The key selector (s= tag). Defaults to 'default'.
+NOVA_DKIM_PRIVATE_KEY:
+    Path to a PEM encoded RSA private key.
+NOVA_DKIM_HEADERS:
+    A list of header names to sign. Defaults to DEFAULT_SIGNED_HEADERS.
+"""
+import re
+import time
+from base64 import b64encode
+from hashlib import sha256
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from dkim.canonicalization import Relaxed
+    from dkim.crypto import parse_pem_private_key, RSASSA_PKCS1_v1_5_sign
+except ImportError:
+    Relaxed = None
+
+DEFAULT_SIGNED_HEADERS = ('From', 'To', 'Subject', 'Date', 'Message-ID',
+        'Reply-To', 'MIME-Version', 'Content-Type',)
+
+# The number of distinct message bodies a signer remembers hashes for
+BODY_CACHE_SIZE = 16
+
+# Parsed private keys, keyed by path. Keys are parsed once per process.
+_private_keys = {}
+
+def load_private_key(path):
+    """
+    Read and parse the PEM encoded RSA private key at path, caching
+    the parsed key for the lifetime of the process.
+    """
+    if Relaxed is None:
+        raise ImproperlyConfigured("DKIM signing requires the dkimpy package.")
+
+    if path not in _private_keys:
+        with open(path, 'rb') as f:
+            _private_keys[path] = parse_pem_private_key(f.read())
+
+    return _private_keys[path]
+
+def _crlf(text):
+    """
+    Normalize the line endings in text to CRLF.
+    """
+    return re.sub(r'\r?\n', '\r\n', text)
+
+class DKIMSigner(object):
+    """
+    Adds DKIM-Signature headers to outgoing email.message.Message instances.
+
+    A signer is meant to live for the duration of a single send. Body hashes are
+    remembered per body_key, so messages sharing a body (e.g. a non-personalized
+    issue sent to many recipients) only pay for hashing their headers.
+    """
+    def __init__(self, domain, selector, private_key, headers=DEFAULT_SIGNED_HEADERS):
+        """
+        :param domain: The signing domain.
+        :param selector: The key selector.
+        :param private_key: A parsed private key, see load_private_key.
+        :param headers: A list of header names to sign.
+        """
+        self.domain = domain
+        self.selector = selector
+        self.private_key = private_key
+        self.headers = [header.lower() for header in headers]
+        self._bodies = {}
+
+    def hash_body(self, msg):
+        """
+        Serialize a message and return the base64 encoded hash of its
+        canonicalized body.
+        """
+        body = msg.as_string().split('\n\n', 1)[-1]
+        return b64encode(sha256(Relaxed.canonicalize_body(_crlf(body))).digest())
+
+    def prepare_body(self, msg, body_key=None):
+        """
+        Fix the MIME boundary of msg and return the hash of its body. When
+        body_key has been seen before the boundary and hash are reused, which
+        makes the body byte-for-byte identical to the earlier message.
+        """
+        if body_key is not None and body_key in self._bodies:
+            boundary, body_hash = self._bodies[body_key]
+            if boundary:
+                msg.set_boundary(boundary)
+            return body_hash
+
+        boundary = None
+        if msg.is_multipart():
+            boundary = '===============nova%s==' % uuid4().hex
+            msg.set_boundary(boundary)
+
+        body_hash = self.hash_body(msg)
+
+        if body_key is not None:
+            if len(self._bodies) >= BODY_CACHE_SIZE:
+                self._bodies.clear()
+            self._bodies[body_key] = (boundary, body_hash)
+
+        return body_hash
+
+    def sign(self, msg, body_key=None):
+        """
+        Add a DKIM-Signature header to msg.
+
+        :param msg: An email.message.Message instance.
+        :param body_key: A hashable key identifying the body of msg, e.g. the
+            (txt_body, html_body) the message was built from.
+        """
+        body_hash = self.prepare_body(msg, body_key=body_key)
+
+        # Select the last instance of each header to sign
+        signed = []
+        items = [(name, _crlf(str(value))) for name, value in msg.items()]
+        for name, value in reversed(items):
+            lower_name = name.lower()
+            if lower_name in self.headers and lower_name not in [n for n, v in signed]:
+                signed.append((lower_name, value))
+        signed.reverse()
+
+        fields = [
+            ('v', '1'),
+            ('a', 'rsa-sha256'),
+            ('c', 'relaxed/relaxed'),
+            ('d', self.domain),
+            ('s', self.selector),
+            ('t', str(int(time.time()))),
+            ('h', ':'.join([name for name, value in signed])),
+            ('bh', body_hash),
+            ('b', ''),
+        ]
+        unsigned_value = '; '.join(['%s=%s' % field for field in fields])
+
+        hasher = sha256()
+        canonicalized = Relaxed.canonicalize_headers(signed + [('DKIM-Signature', unsigned_value)])
+        for name, value in canonicalized[:-1]:
+            hasher.update('%s:%s' % (name, value))
+        # The signature header itself is hashed without its trailing CRLF
+        name, value = canonicalized[-1]
+        hasher.update('%s:%s' % (name, value.rstrip('\r\n')))
+
+        signature = b64encode(RSASSA_PKCS1_v1_5_sign(hasher, self.private_key))
+        msg['DKIM-Signature'] = unsigned_value + signature
+
+        return msg
+
+def get_signer():
+    """
+    Return a DKIMSigner configured from the project settings, or None if
+    DKIM signing has not been configured.
+    """
+    domain = getattr(settings, 'NOVA_DKIM_DOMAIN', None)
+    if not domain:
+        return None
+
+    key_path = getattr(settings, 'NOVA_DKIM_PRIVATE_KEY', None)
+    if not key_path:
+        raise ImproperlyConfigured("NOVA_DKIM_PRIVATE_KEY must be set when NOVA_DKIM_DOMAIN is set.")
+
+    return DKIMSigner(domain,
+            getattr(settings, 'NOVA_DKIM_SELECTOR', 'default'),
+            load_private_key(key_path),
+            headers=getattr(settings, 'NOVA_DKIM_HEADERS', DEFAULT_SIGNED_HEADERS))
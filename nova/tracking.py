@@ -0,0 +1,246 @@
+"""
+Click tracking for links in newsletter issues.
+
+When NOVA_CLICK_TRACKING is enabled, premailing an issue records every
+absolute link in it as a TrackedLink and points the link at the click view
+(see nova.urls), which redirects to the original url. Links are identified by
+a short base 62 encoding of their primary key. Personalized copies of an issue
+only route the links of the issue's shared render, so links that differ per
+recipient (an unsubscribe link with a token, say) are left as they are.
+
+Clicks arrive in bursts right after a send, so the click view doesn't write
+to the database itself. Clicks are counted in memory by a BufferedCounter and
+written in batches, with one UPDATE per distinct count rather than per click.
+
+project specific settings:
+NOVA_CLICK_TRACKING:
+    If True, route the links of issues through the click view. Defaults to False.
+NOVA_CLICK_FLUSH_SIZE:
+    The number of buffered clicks that triggers a write. Defaults to 100.
+NOVA_CLICK_FLUSH_INTERVAL:
+    The number of seconds after which buffered clicks are written by the next
+    click, however few there are. Defaults to 10.
+NOVA_TRACKED_LINK_CACHE_SIZE:
+    The number of link urls the click view keeps in memory. Defaults to 1024.
+
+Opens are tracked the same way. When NOVA_OPEN_TRACKING is enabled, premail adds
+a one pixel image to issues that points at the open view, and each recipient's
+copy of the issue identifies them in the image url. The url is signed with
+SECRET_KEY, so opens can't be recorded for other recipients by guessing their
+ids. The open view answers with a constant GIF and buffers opens per (issue,
+recipient) pair, which are written as a bulk insert of new pairs and batched
+updates of known ones. Copies of an issue that aren't sent (the preview and the
+web archive) have the pixel removed.
+
+NOVA_OPEN_TRACKING:
+    If True, add an open tracking pixel to issues. Defaults to False.
+NOVA_OPEN_FLUSH_SIZE:
+    The number of buffered opens that triggers a write. Defaults to 500.
+NOVA_OPEN_FLUSH_INTERVAL:
+    The number of seconds after which buffered opens are written by the next
+    open, however few there are. Defaults to 10.
+"""
+import re
+import string
+import threading
+import time
+
+from django.core.urlresolvers import reverse
+from django.db import close_connection
+from django.utils.crypto import salted_hmac, constant_time_compare
+
+from BeautifulSoup import Tag
+
+ALPHABET = string.digits + string.ascii_letters
+
+def encode_id(number):
+    """
+    Return a compact base 62 string for a non-negative integer.
+    """
+    if number < 0:
+        raise ValueError('Cannot encode negative number %s' % (number,))
+
+    digits = []
+    while True:
+        number, remainder = divmod(number, len(ALPHABET))
+        digits.append(ALPHABET[remainder])
+        if not number:
+            break
+    return ''.join(reversed(digits))
+
+def decode_id(encoded):
+    """
+    Return the integer encoded by encode_id(). Raises ValueError for
+    strings encode_id() can't produce.
+    """
+    if not encoded:
+        raise ValueError('Cannot decode an empty string')
+
+    number = 0
+    for char in encoded:
+        index = ALPHABET.find(char)
+        if index == -1:
+            raise ValueError('Invalid character %r in %r' % (char, encoded))
+        number = number * len(ALPHABET) + index
+    return number
+
+class BufferedCounter(object):
+    """
+    A thread safe counter that buffers counts per key in memory and hands
+    them to flush_function, as a dictionary of key to count, once max_pending
+    counts have accumulated or interval seconds have passed since the last
+    flush. Counts that fail to flush are kept for the next attempt.
+
+    If background is True, flushes that come due are run on a separate thread
+    (one at a time) so the caller of add() never waits for them.
+    """
+    def __init__(self, flush_function, max_pending=100, interval=10, background=False):
+        self.flush_function = flush_function
+        self.max_pending = max_pending
+        self.interval = interval
+        self.background = background
+        self.counts = {}
+        self.pending = 0
+        self.last_flush = time.time()
+        self._lock = threading.Lock()
+        self._flushing = False
+
+    def add(self, key, count=1):
+        """
+        Count key, flushing the buffer if it is due.
+        """
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + count
+            self.pending += count
+            due = self.pending >= self.max_pending or time.time() - self.last_flush >= self.interval
+            if due and self.background:
+                # Leave the counts buffered if a flush is already running
+                due = not self._flushing
+                self._flushing = due
+
+        if due and self.background:
+            thread = threading.Thread(target=self._flush_in_background)
+            thread.daemon = True
+            thread.start()
+        elif due:
+            self.flush()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            # The counts were kept and are retried by the next flush
+            pass
+        finally:
+            self._flushing = False
+            # Threads get their own database connection
+            close_connection()
+
+    def flush(self):
+        """
+        Hand all buffered counts to flush_function.
+        """
+        with self._lock:
+            counts, self.counts = self.counts, {}
+            self.pending = 0
+            self.last_flush = time.time()
+
+        if not counts:
+            return
+
+        try:
+            self.flush_function(counts)
+        except:
+            # Put the counts back so they are written by a later flush
+            with self._lock:
+                for key, count in counts.items():
+                    self.counts[key] = self.counts.get(key, 0) + count
+                    self.pending += count
+            raise
+
+def track_clicks(soup, newsletter_issue, base_url, create=True):
+    """
+    Point every absolute http(s) link in a parsed document at the click view.
+
+    :param soup: The parsed document, which is modified in place and returned.
+    :param newsletter_issue: The NewsletterIssue the links belong to.
+    :param base_url: The scheme and domain of the click view, e.g. 'http://example.com'.
+    :param create: Whether to create TrackedLinks for new urls. If False, only
+        links the issue already tracks are pointed at the click view.
+    """
+    anchors = [anchor for anchor in soup.findAll('a', href=True)
+            if anchor['href'].strip().lower().startswith(('http://', 'https://'))]
+    if not anchors:
+        return soup
+
+    link_ids = newsletter_issue.get_tracked_links([anchor['href'].strip() for anchor in anchors], create=create)
+
+    for anchor in anchors:
+        link_id = link_ids.get(anchor['href'].strip())
+        if link_id is not None:
+            anchor['href'] = base_url + reverse('nova.views.click', args=[encode_id(link_id)])
+
+    return soup
+
+# A transparent 1x1 GIF
+PIXEL_GIF = ('GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff'
+        '!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+# Stand in for the recipient's id and signature in the open pixel url of a premailed issue
+RECIPIENT_PLACEHOLDER = 'RECIPIENT'
+SIGNATURE_PLACEHOLDER = 'SIGNATURE'
+
+def sign_open(issue_id, recipient_id):
+    """
+    Return the signature of the open pixel url for an issue and
+    recipient, given their primary keys.
+    """
+    return salted_hmac('nova.tracking.open', '%s:%s' % (issue_id, recipient_id)).hexdigest()[:12]
+
+def check_open_signature(issue_id, recipient_id, signature):
+    """
+    Return True if signature is the signature of the open pixel url
+    for an issue and recipient.
+    """
+    return constant_time_compare(sign_open(issue_id, recipient_id), signature)
+
+def get_open_pixel_url(base_url, issue_id, recipient_id=RECIPIENT_PLACEHOLDER):
+    """
+    Return the signed url of the open pixel for an issue and recipient,
+    given their primary keys. Without recipient_id the url has placeholders
+    that personalize_open_pixel() replaces for each recipient.
+    """
+    if recipient_id == RECIPIENT_PLACEHOLDER:
+        args = [encode_id(issue_id), RECIPIENT_PLACEHOLDER, SIGNATURE_PLACEHOLDER]
+    else:
+        args = [encode_id(issue_id), encode_id(recipient_id), sign_open(issue_id, recipient_id)]
+    return base_url + reverse('nova.views.open_pixel', args=args)
+
+def add_open_pixel(soup, url):
+    """
+    Append an open pixel image pointing at url to the body of a parsed
+    document, which is modified in place and returned.
+    """
+    attrs = [('src', url), ('width', '1'), ('height', '1'), ('alt', ''), ('border', '0')]
+    if type(soup).__module__.startswith('bs4'):
+        pixel = soup.new_tag('img', **dict(attrs))
+    else:
+        pixel = Tag(soup, 'img', attrs)
+
+    (soup.find('body') or soup).append(pixel)
+    return soup
+
+def personalize_open_pixel(html, base_url, issue_id, recipient_id):
+    """
+    Replace the placeholder open pixel url in a premailed issue with
+    the url for one recipient.
+    """
+    return html.replace(get_open_pixel_url(base_url, issue_id),
+            get_open_pixel_url(base_url, issue_id, recipient_id))
+
+def remove_open_pixel(html, base_url, issue_id):
+    """
+    Remove the placeholder open pixel from a premailed issue, e.g.
+    for copies of the issue that aren't sent to a recipient.
+    """
+    return re.sub(r'<img[^>]*src="%s"[^>]*>' % (re.escape(get_open_pixel_url(base_url, issue_id)),), '', html)
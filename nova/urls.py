@@ -11,6 +11,8 @@ urlpatterns = patterns('nova.views',
     (r'subscribe/', 'subscribe'),
     (r'update_subscriptions/', 'update_subscriptions'),
     (r'confirm/(?P<token>\w+)/', 'confirm'),
-    (r'preview/(?P<newsletter_issue_id>\d+)/', 'preview')
+    (r'preview/(?P<newsletter_issue_id>\d+)/', 'preview'),
+    (r'c/(?P<link_id>[0-9A-Za-z]+)/', 'click'),
+    (r'o/(?P<issue_id>[0-9A-Za-z]+)/(?P<recipient_id>[0-9A-Za-z]+)/(?P<signature>[0-9A-Za-z]+)\.gif', 'open_pixel'),
 )
 
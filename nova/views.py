@@ -1,21 +1,25 @@
 """
 Newsletter registration views
 """
+import time
 from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect, Http404
 from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django.contrib.sites.models import RequestSite
+from django.contrib.sites.models import Site, RequestSite
 from django.contrib.auth.decorators import permission_required
 from django.views.generic.simple import redirect_to
 from django.template import RequestContext, Context, loader 
 from django.shortcuts import render_to_response, get_object_or_404
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
 from django.utils.translation import ugettext_lazy as _
 
-from nova.models import EmailAddress, Subscription, Newsletter, NewsletterIssue, _sanitize_email, _email_is_valid
+from nova.models import EmailAddress, Subscription, Newsletter, NewsletterIssue, TrackedLink, \
+        get_click_counter, get_open_counter, _sanitize_email, _email_is_valid
+from nova.tracking import decode_id, check_open_signature, remove_open_pixel, PIXEL_GIF
 from nova.forms import NovaSubscribeForm, NovaUnsubscribeForm, SubscriptionForm
 
 def _send_message(to_addr, subject_template, body_template, context_vars):
@@ -177,16 +181,85 @@ def acknowledge_unsubscribe(request, template_name='nova/acknowledge_unsubscribe
 @permission_required('nova.change_newsletterissue')
 def preview(request, newsletter_issue_id):
     """
-    Render the specified newsletter issue with a random EmailAddress
+    Show the specified newsletter issue exactly as it will be mailed
     so an admin can preview a newsletter before mailing it.
+
+    The stored, premailed issue is served with an ETag and Last-Modified
+    header, so reloading an unchanged preview is answered with a 304.
+    Personalized issues (see NOVA_RECIPIENT_CONTEXT_PROCESSORS) are rendered
+    for a sample recipient instead: the first, or the first whose primary key
+    is at least the 'recipient' query parameter. Previews don't count opens.
     """
-    email = None
     issue = get_object_or_404(NewsletterIssue, id=newsletter_issue_id)
-    subscribers = issue.newsletter.subscribers.order_by('?')
+    base_url = 'http://%s' % (Site.objects.get_current().domain,)
+
+    if getattr(settings, 'NOVA_RECIPIENT_CONTEXT_PROCESSORS', ()):
+        try:
+            start = int(request.GET.get('recipient', 0))
+        except ValueError:
+            start = 0
+        sample = list(issue.recipients.filter(pk__gte=start)[:1])
+        if sample:
+            premailed_template, _ = issue.get_personalized_artifacts(sample[0])
+            return HttpResponse(remove_open_pixel(premailed_template, base_url, issue.pk))
+
+    premailed_template, _ = issue.get_artifacts()
+
+    # rendered_at is naive local time
+    last_modified = int(time.mktime(issue.rendered_at.timetuple()))
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        not_modified = bool(issue.rendered_hash) and (issue.rendered_hash in etags or '*' in etags)
+    else:
+        not_modified = if_modified_since is not None and last_modified <= if_modified_since
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(remove_open_pixel(premailed_template, base_url, issue.pk))
+
+    # Artifacts premailed by the fallback have no hash, and are replaced when next needed
+    if issue.rendered_hash:
+        response['ETag'] = quote_etag(issue.rendered_hash)
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def click(request, link_id):
+    """
+    Count a click on a tracked link and redirect to its url.
+    """
+    try:
+        pk = decode_id(link_id)
+    except ValueError:
+        raise Http404
+
+    url = TrackedLink.objects.get_url(pk)
+    if url is None:
+        raise Http404
+
+    get_click_counter().add(pk)
+    return HttpResponseRedirect(url)
+
+def open_pixel(request, issue_id, recipient_id, signature):
+    """
+    Count an open of an issue by a recipient and answer with a transparent
+    GIF. Opens are buffered in memory, so this view never waits on the database.
+    Opens whose url isn't signed for the issue and recipient are ignored.
+    """
+    try:
+        key = (decode_id(issue_id), decode_id(recipient_id))
+    except ValueError:
+        key = None
+
+    if key is not None and not check_open_signature(key[0], key[1], signature):
+        key = None
 
-    if subscribers.count() > 0:
-        email = subscribers[0]
+    if key is not None:
+        get_open_counter().add(key)
 
-    premailed_template, _ = issue.premail(track=issue.track, plaintext=False,
-            template=issue.render())
-    return HttpResponse(premailed_template)
+    response = HttpResponse(PIXEL_GIF, content_type='image/gif')
+    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    return response
@@ -0,0 +1,54 @@
+"""
+Volume quotas for warming up new sending infrastructure.
+
+project specific settings:
+NOVA_WARMUP_SCHEDULE:
+    A list of (daily, hourly) message limits, one entry per day of the warm-up.
+    Either limit may be None to leave it unbounded. The last entry applies to
+    every day after the schedule ends, so a single entry acts as a flat quota.
+NOVA_WARMUP_START:
+    The date of the first day of NOVA_WARMUP_SCHEDULE. Required when the
+    schedule has more than one entry.
+
+When a quota is used up, sends of an issue to its subscribers pause and record
+how far they got. The resume_sends management command continues them in a
+later window.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DAY = 'day'
+HOUR = 'hour'
+
+def get_quota_limits(now=None):
+    """
+    Return the (daily, hourly) limits in effect at now, or None if no
+    warm-up schedule is configured.
+    """
+    schedule = getattr(settings, 'NOVA_WARMUP_SCHEDULE', None)
+    if not schedule:
+        return None
+
+    now = now or datetime.now()
+    start = getattr(settings, 'NOVA_WARMUP_START', None)
+    if start is None:
+        # Without a fixed start the schedule would never get past its first day
+        if len(schedule) > 1:
+            raise ImproperlyConfigured("NOVA_WARMUP_START must be set when NOVA_WARMUP_SCHEDULE has more than one entry.")
+        start = now.date()
+    day = min(max((now.date() - start).days, 0), len(schedule) - 1)
+
+    return tuple(schedule[day])
+
+def get_windows(now=None):
+    """
+    Return the start of the current daily and hourly windows as a
+    dictionary keyed by period.
+    """
+    now = now or datetime.now()
+    return {
+        DAY: datetime(now.year, now.month, now.day),
+        HOUR: datetime(now.year, now.month, now.day, now.hour),
+    }
@@ -0,0 +1,233 @@
+"""
+A pool of long lived premailer processes.
+
+Starting the premailer (Ruby) interpreter dominates the cost of a premailer
+call. The pool keeps a few workers (see bin/premailer_worker.rb) running and
+sends them requests over a pipe instead of spawning a process per call.
+
+project specific settings:
+NOVA_PREMAILER_WORKERS:
+    The number of premailer workers to keep running. Defaults to 0, which
+    disables the pool and runs premailer as a subprocess per call.
+NOVA_PREMAILER_WORKER_MAX_REQUESTS:
+    The number of requests a worker serves before it is replaced. Defaults to 500.
+NOVA_PREMAILER_WORKER_COMMAND:
+    The command used to start a worker. Defaults to running bin/premailer_worker.rb.
+NOVA_PREMAILER_WORKER_WAIT:
+    The number of seconds a call waits for a busy worker before giving up
+    with StageTimeout. Defaults to 60.
+"""
+import os
+import threading
+import time
+from subprocess import Popen, PIPE
+
+from django.conf import settings
+from django.utils.encoding import smart_str
+
+from nova.helpers import PremailerException
+from nova.budgets import StageTimeout
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'bin', 'premailer_worker.rb')
+
+class WorkerCrashed(Exception):
+    """
+    Exception thrown when a worker process exits or breaks the protocol
+    """
+
+class PremailerWorker(object):
+    """
+    A single premailer process.
+    """
+    def __init__(self, command):
+        self.requests = 0
+        self.timed_out = False
+        self._answered = False
+        self._lock = threading.Lock()
+        self._devnull = open(os.devnull, 'w')
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=self._devnull)
+
+    def request(self, template, mode='html', timeout=None):
+        """
+        Send a template to the worker and return the premailed result. If
+        the worker doesn't answer within timeout seconds it is killed and
+        StageTimeout is raised.
+        """
+        template = smart_str(template)
+        self.requests += 1
+        self._answered = False
+
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._time_out)
+            timer.start()
+
+        try:
+            self.process.stdin.write('%s %d\n' % (mode, len(template)))
+            self.process.stdin.write(template)
+            self.process.stdin.flush()
+
+            header = self.process.stdout.readline()
+            if not header:
+                raise WorkerCrashed('Premailer worker exited with status %s.' % (self.process.poll(),))
+            status, length = header.split()
+            body = self.process.stdout.read(int(length))
+            with self._lock:
+                self._answered = True
+        except (IOError, ValueError, WorkerCrashed), e:
+            if self.timed_out:
+                raise StageTimeout('Premailer worker took longer than %s seconds and was killed.' % (timeout,))
+            raise WorkerCrashed(str(e))
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if self.timed_out:
+            # The worker was killed while its answer was being read
+            raise StageTimeout('Premailer worker took longer than %s seconds and was killed.' % (timeout,))
+        if status != 'ok':
+            raise PremailerException(body)
+        return body
+
+    def _time_out(self):
+        # Only kill the worker if it hasn't answered in the meantime
+        with self._lock:
+            if not self._answered:
+                self.kill(timed_out=True)
+
+    def kill(self, timed_out=False):
+        """
+        Kill the worker, e.g. when it is stuck on a request.
+        """
+        self.timed_out = timed_out
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def stop(self):
+        """
+        Ask the worker to exit by closing its input, killing it if needed.
+        """
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        if self.process.poll() is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+        self.process.wait()
+        self._devnull.close()
+
+class PremailerPool(object):
+    """
+    A thread safe pool of premailer workers. Workers are started on demand,
+    restarted when they crash and replaced after serving max_requests. Calls
+    wait up to wait_timeout seconds for a worker when all of them are busy.
+    """
+    def __init__(self, size, command, max_requests=500, wait_timeout=60):
+        self.size = size
+        self.command = command
+        self.max_requests = max_requests
+        self.wait_timeout = wait_timeout
+        self.idle = []
+        self.started = 0
+        # Signalled whenever a worker becomes idle or a slot for a new one opens up
+        self._available = threading.Condition(threading.Lock())
+
+    def _acquire(self, timeout=None):
+        if timeout is None or (self.wait_timeout is not None and self.wait_timeout < timeout):
+            timeout = self.wait_timeout
+        deadline = time.time() + timeout if timeout is not None else None
+
+        with self._available:
+            while not self.idle and self.started >= self.size:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise StageTimeout('No premailer worker became available within %s seconds.' % (timeout,))
+                self._available.wait(remaining)
+
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+
+        try:
+            return PremailerWorker(self.command)
+        except OSError:
+            self._forget()
+            raise
+
+    def _release(self, worker):
+        with self._available:
+            self.idle.append(worker)
+            self._available.notify()
+
+    def _forget(self):
+        with self._available:
+            self.started -= 1
+            self._available.notify()
+
+    def _discard(self, worker):
+        worker.stop()
+        self._forget()
+
+    def premail(self, template, mode='html', timeout=None):
+        """
+        Premail template on an idle worker. A request that crashes its
+        worker is retried once on a fresh worker; one that runs over
+        timeout seconds is not.
+        """
+        for attempt in (1, 2):
+            worker = self._acquire(timeout)
+            try:
+                result = worker.request(template, mode, timeout=timeout)
+            except StageTimeout:
+                self._discard(worker)
+                raise
+            except WorkerCrashed, e:
+                self._discard(worker)
+                if attempt == 2:
+                    raise PremailerException(str(e))
+                continue
+            except:
+                self._release(worker)
+                raise
+
+            if worker.requests >= self.max_requests:
+                self._discard(worker)
+            else:
+                self._release(worker)
+            return result
+
+    def close(self):
+        """
+        Stop all idle workers.
+        """
+        while True:
+            with self._available:
+                if not self.idle:
+                    break
+                worker = self.idle.pop()
+            self._discard(worker)
+
+_pool = None
+
+def get_premailer_pool():
+    """
+    Return the process wide premailer pool, or None if the pool
+    has not been enabled.
+    """
+    global _pool
+
+    size = getattr(settings, 'NOVA_PREMAILER_WORKERS', 0)
+    if not size:
+        return None
+
+    if _pool is None:
+        _pool = PremailerPool(size,
+                getattr(settings, 'NOVA_PREMAILER_WORKER_COMMAND', ['ruby', WORKER_SCRIPT]),
+                max_requests=getattr(settings, 'NOVA_PREMAILER_WORKER_MAX_REQUESTS', 500),
+                wait_timeout=getattr(settings, 'NOVA_PREMAILER_WORKER_WAIT', 60))
+    return _pool